@@ -0,0 +1,166 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from engine import *
+from position import Position, move_name
+
+# Futures kept in flight per worker, so large input files are streamed rather than queued up front
+QUEUE_PER_WORKER = 4
+PROGRESS_INTERVAL = 2.0
+
+_analysis_searcher = None
+
+
+def parse_epd_operations(text):
+    operations = {}
+    for operation in text.split(';'):
+        operation = operation.strip()
+        if not operation:
+            continue
+        opcode, _, operand = operation.partition(' ')
+        operations[opcode] = operand.strip().strip('"')
+    return operations
+
+
+def parse_record(line):
+    # Accepts full FEN lines and EPD lines (four FEN fields followed by opcodes such as bm and id)
+    fields = line.split()
+    if len(fields) < 2:
+        raise ValueError(f"Invalid position: {line}")
+    fen_fields = fields[:4]
+    rest = fields[4:]
+    if len(rest) >= 2 and rest[0].isdigit() and rest[1].isdigit():
+        fen_fields += rest[:2]
+        rest = rest[2:]
+    operations = parse_epd_operations(' '.join(rest))
+    position = Position.from_fen(' '.join(fen_fields))
+    return position, operations
+
+
+def read_positions(lines):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        yield number, line
+
+
+def _init_analysis_worker(hash_mb):
+    global _analysis_searcher
+    _analysis_searcher = Searcher(hash_mb)
+
+
+def analyse_line(index, line, depth=None, max_time_ms=None, max_nodes=None, searcher=None):
+    if searcher is None:
+        searcher = _analysis_searcher
+    result = {'index': index, 'input': line}
+    try:
+        position, operations = parse_record(line)
+    except (ValueError, KeyError) as error:
+        result['error'] = str(error)
+        return result
+    result['fen'] = position.fen()
+    if 'id' in operations:
+        result['id'] = operations['id']
+    # Positions are independent, so nothing learned on the previous one should carry over
+    searcher.table.clear()
+    start = time.perf_counter()
+    score, move = searcher.find_best_move(position, depth, max_time_ms, max_nodes)
+    elapsed = time.perf_counter() - start
+    result.update({'bestmove': move_name(move) if move is not None else None, 'score': format_score(score),
+                   'depth': searcher.completed_depth, 'nodes': searcher.nodes,
+                   'time_ms': round(elapsed * 1000, 3), 'nps': int(searcher.nodes / elapsed) if elapsed else 0,
+                   'pv': [move_name(pv_move) for pv_move in searcher.pv]})
+    if 'bm' in operations:
+        result['expected'] = operations['bm']
+    return result
+
+
+def analyse_positions(records, depth=None, max_time_ms=None, max_nodes=None, workers=1,
+                      ordered=True, hash_mb=DEFAULT_HASH_MB):
+    # Yields one result per (index, line) record, in input order or as soon as each finishes
+    if workers <= 1:
+        searcher = Searcher(hash_mb)
+        for index, line in records:
+            yield analyse_line(index, line, depth, max_time_ms, max_nodes, searcher)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_analysis_worker, initargs=(hash_mb,)) as pool:
+        pending = {}
+        finished = {}
+        order = []
+        records = iter(records)
+        exhausted = False
+        while True:
+            # Finished results held back behind a slow one count against the window too
+            while not exhausted and len(pending) + len(finished) < workers * QUEUE_PER_WORKER:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                    break
+                index, line = record
+                pending[pool.submit(analyse_line, index, line, depth, max_time_ms, max_nodes)] = index
+                if ordered:
+                    order.append(index)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                if ordered:
+                    finished[index] = future.result()
+                else:
+                    yield future.result()
+            # Results that finish early wait here until everything before them is out
+            while ordered and order and order[0] in finished:
+                yield finished.pop(order.pop(0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse every position in a FEN or EPD file and write JSON lines")
+    parser.add_argument('input', nargs='?', default='-', help="file with one FEN or EPD record per line (default: stdin)")
+    parser.add_argument('-o', '--output', default='-', help="where to write the JSON lines (default: stdout)")
+    parser.add_argument('--depth', type=int, help="search depth per position")
+    parser.add_argument('--movetime', type=int, help="time budget per position in milliseconds")
+    parser.add_argument('--nodes', type=int, help="node budget per position")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--hash', type=int, default=DEFAULT_HASH_MB, help="transposition table size per worker in MB")
+    parser.add_argument('--order', choices=['input', 'completion'], default='input')
+    parser.add_argument('--quiet', action='store_true', help="do not report progress on stderr")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    start = last_report = time.perf_counter()
+    count = nodes = errors = 0
+    try:
+        results = analyse_positions(read_positions(source), args.depth, args.movetime, args.nodes,
+                                    args.workers, args.order == 'input', args.hash)
+        for result in results:
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            count += 1
+            nodes += result.get('nodes', 0)
+            errors += 'error' in result
+            now = time.perf_counter()
+            if not args.quiet and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                elapsed = now - start
+                print(f"{count} positions, {count / elapsed:.2f} positions/s, {int(nodes / elapsed)} nps",
+                      file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        print(f"done: {count} positions ({errors} errors) in {elapsed:.2f}s, "
+              f"{count / elapsed if elapsed else 0:.2f} positions/s, {int(nodes / elapsed) if elapsed else 0} nps",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
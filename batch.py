@@ -0,0 +1,107 @@
+import argparse
+import json
+from position import Position, ROOK, KING, PIECE_SQUARE_VALUES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Positions scored per vectorised call by the bulk API
+BATCH_SIZE = 4096
+
+if np is not None:
+    # (12, 64) material plus piece-square weights, one row per piece in the board's table order
+    # (white pawn to king, then black king to pawn). PIECE_SQUARE_VALUES is built from
+    # PIECE_VALUES and the *_POSITION_VALUES tables, so these are the weights of calculate_board_score.
+    WEIGHTS = np.array(PIECE_SQUARE_VALUES[1:], dtype=np.float64)
+    # With a zero row for empty squares in front, a piece code indexes its own row directly:
+    # white codes count from the front and black (negative) codes from the back
+    _LOOKUP = np.vstack([np.zeros((1, 64)), WEIGHTS])
+    _SQUARES = np.arange(64)
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("Batched evaluation needs NumPy (pip install numpy)")
+
+
+def stack_boards(positions):
+    # (N, 64) int8 array of piece codes
+    require_numpy()
+    return np.array([position.board for position in positions], dtype=np.int8).reshape(-1, 64)
+
+
+def evaluate_boards(boards):
+    # White's score for every row of an (N, 64) board array, in one gather and sum
+    require_numpy()
+    return _LOOKUP[boards, _SQUARES].sum(axis=1)
+
+
+def evaluate_positions(positions):
+    return evaluate_boards(stack_boards(positions))
+
+
+def evaluate_children(position, moves):
+    # White's score after each of moves, without making them: the parent board is copied once
+    # per move and every copy updated together, castling rooks included
+    require_numpy()
+    count = len(moves)
+    boards = np.repeat(np.array(position.board, dtype=np.int8)[None], count, axis=0)
+    if not count:
+        return evaluate_boards(boards)
+    encoded = np.array(moves, dtype=np.int64)
+    starts, ends = encoded & 63, encoded >> 6 & 63
+    rows = np.arange(count)
+    pieces = boards[rows, starts]
+    boards[rows, ends] = pieces
+    boards[rows, starts] = 0
+    castles = (np.abs(pieces) == KING) & (np.abs(ends - starts) == 2)
+    if castles.any():
+        rows, starts, ends = rows[castles], starts[castles], ends[castles]
+        kingside = ends > starts
+        boards[rows, np.where(kingside, starts + 3, starts - 4)] = 0
+        boards[rows, np.where(kingside, starts + 1, starts - 1)] = ROOK * position.side
+    return evaluate_boards(boards)
+
+
+def score_fens(fens, batch_size=BATCH_SIZE):
+    # Scores for any number of FEN strings, parsed and evaluated batch_size at a time
+    require_numpy()
+    scores = []
+    batch = []
+    for fen in fens:
+        batch.append(Position.from_fen(fen))
+        if len(batch) == batch_size:
+            scores.append(evaluate_positions(batch))
+            batch = []
+    if batch:
+        scores.append(evaluate_positions(batch))
+    return np.concatenate(scores) if scores else np.zeros(0)
+
+
+def rank_fens(fens, limit=None, batch_size=BATCH_SIZE):
+    # (score, fen) pairs from best for white to worst, limit of them when given
+    fens = list(fens)
+    scores = score_fens(fens, batch_size)
+    order = np.argsort(-scores, kind='stable')
+    if limit is not None:
+        order = order[:limit]
+    return [(float(scores[index]), fens[index]) for index in order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every position of a FEN file, one FEN per line")
+    parser.add_argument('path')
+    parser.add_argument('--top', type=int, help="only print the best positions for white")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    with open(args.path) as fen_file:
+        fens = [line.strip() for line in fen_file if line.strip()]
+    ranked = rank_fens(fens, args.top, args.batch_size)
+    print(json.dumps([{'fen': fen, 'score': score} for score, fen in ranked], indent=2))
+
+
+if __name__ == "__main__":
+    main()
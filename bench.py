@@ -0,0 +1,543 @@
+import argparse
+import copy
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from engine import *
+from batch import evaluate_boards, evaluate_children, stack_boards
+from game import GameState
+from perft import STANDARD_POSITIONS, reference_is_king_under_attack, run_perft
+from position import Position, SIDE_COLORS, move_name
+from stats import SearchStats, print_info, profile_call
+
+BENCH_POSITIONS = {
+    'italian': 'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'queens_gambit': 'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8',
+    'kiwipete': STANDARD_POSITIONS['kiwipete'],
+    'pinned_bishops': 'r2q1rk1/ppp2ppp/2np1n2/2b1p1B1/2B1P1b1/2NP1N2/PPP2PPP/R2Q1RK1 w - - 0 8',
+    'open_center': 'r1b2rk1/pp1nqppp/2p1pn2/8/2BP4/2N2N2/PPQ2PPP/R3K2R b KQ - 0 11',
+    'rook_endgame': '8/5pk1/6p1/8/3R4/6P1/5PKP/3r4 w - - 0 1',
+    'queen_vs_pawns': '6k1/5ppp/8/8/8/8/5PPP/3Q2K1 w - - 0 1',
+    'pawn_endgame': '8/8/8/4k3/8/8/4P3/4K3 w - - 0 1',
+    'rook_vs_king': '8/8/4k3/8/2K5/8/3R4/8 w - - 0 1',
+}
+
+# Tactics with a single material-winning solution, as EPD style best-move lists
+TACTICAL_POSITIONS = {
+    'knight_fork': ('4k3/8/q7/1N6/8/8/8/4K3 w - - 0 1', 'b5c7'),
+    'back_rank': ('6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1', 'd1d8'),
+    'hanging_queen': ('r3k2r/ppp2ppp/2n5/3q4/8/2N5/PPP2PPP/R3K2R w KQkq - 0 1', 'c3d5'),
+    'skewer': ('q7/8/8/3k4/8/8/8/4KB2 w - - 0 1', 'f1g2'),
+    'defended_rook': ('4k3/8/4p3/3r4/n7/8/8/3QK3 w - - 0 1', 'd1a4'),
+    'discovered_check': ('8/4q3/8/8/5k2/4N3/8/4R1K1 w - - 0 1', 'e3d5 e3g2'),
+}
+
+
+def random_positions(count, seed=1, max_plies=80):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position.from_board(STARTING_BOARD, 'w', reset_castling_rights())
+        for _ in range(rng.randint(1, max_plies)):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            position.make_move(rng.choice(moves))
+        position.stack = []
+        positions.append(position)
+    return positions
+
+
+def bench_attacks(count=500, seed=1, repeat=5):
+    positions = random_positions(count, seed)
+    queries = []
+    for position in positions:
+        board = position.to_board()
+        rights = position.castling_rights()
+        for side in (1, -1):
+            king = position.kings[side]
+            if king is not None:
+                queries.append((position, board, rights, side, king))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reference = [reference_is_king_under_attack(board, divmod(king, 8), SIDE_COLORS[side], rights)
+                     for _, board, rights, side, king in queries]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fast = [position.is_attacked(king, -side) for position, _, _, side, king in queries]
+    fast_time = time.perf_counter() - start
+
+    calls = len(queries) * repeat
+    return {
+        'queries': len(queries),
+        'checks': sum(fast),
+        'mismatches': sum(a != b for a, b in zip(reference, fast)),
+        'reference_us_per_call': round(reference_time / calls * 1e6, 3),
+        'fast_us_per_call': round(fast_time / calls * 1e6, 3),
+        'speedup': round(reference_time / fast_time, 2) if fast_time else 0.0,
+    }
+
+
+def bench_search(depth=4, positions=BENCH_POSITIONS, searcher_factory=Searcher, stats=False, info=None,
+                 position_class=Position, **options):
+    results = []
+    for name, fen in positions.items():
+        searcher = searcher_factory(**options)
+        position = position_class.from_fen(fen)
+        search_stats = SearchStats() if stats else None
+        start = time.perf_counter()
+        score, move = searcher.find_best_move(position, depth, stats=search_stats, info=info)
+        elapsed = time.perf_counter() - start
+        results.append({'name': name, 'fen': fen, 'nodes': searcher.nodes, 'time': round(elapsed, 6),
+                        'nps': int(searcher.nodes / elapsed) if elapsed else 0,
+                        'move': move_name(move) if move is not None else None, 'score': format_score(score),
+                        'cutoffs': searcher.cutoffs, 'first_move_cutoffs': searcher.first_move_cutoffs,
+                        'null_cutoffs': searcher.null_cutoffs, 'reductions': searcher.reductions,
+                        'researches': searcher.researches, 'generations': searcher.generations,
+                        'legality_checks': searcher.legality_checks,
+                        'quiet_stages_skipped': searcher.quiet_stages_skipped})
+        if search_stats is not None:
+            results[-1]['stats'] = search_stats.as_dict()
+    nodes = sum(result['nodes'] for result in results)
+    elapsed = sum(result['time'] for result in results)
+    cutoffs = sum(result['cutoffs'] for result in results)
+    first_move_cutoffs = sum(result['first_move_cutoffs'] for result in results)
+    # The total node count doubles as a signature: it only changes when the search does
+    return {'depth': depth, 'options': options, 'positions': results, 'nodes': nodes, 'time': round(elapsed, 6),
+            'nps': int(nodes / elapsed) if elapsed else 0,
+            'first_move_cutoff_rate': round(first_move_cutoffs / cutoffs, 4) if cutoffs else 0.0}
+
+
+def bench_ordering(depth=4, positions=BENCH_POSITIONS):
+    unordered = bench_search(depth, positions, move_ordering=False)
+    ordered = bench_search(depth, positions, move_ordering=True)
+    return {'depth': depth,
+            'nodes_without_ordering': unordered['nodes'], 'nodes_with_ordering': ordered['nodes'],
+            'first_move_cutoff_rate_without_ordering': unordered['first_move_cutoff_rate'],
+            'first_move_cutoff_rate_with_ordering': ordered['first_move_cutoff_rate'],
+            'time_without_ordering': unordered['time'], 'time_with_ordering': ordered['time']}
+
+
+SELECTIVITY_FEATURES = ('null_move', 'late_move_reductions', 'pvs', 'aspiration')
+# Extra plies the selectivity features were meant to reach within the same time budget
+SELECTIVITY_TARGET_PLIES = (2, 3)
+
+
+def bench_staged(depth=4, positions=BENCH_POSITIONS):
+    # Full move lists against the staged picker, per search: the move list generations and move
+    # legality checks the staged picker never makes, and what that is worth in time
+    counters = ('nodes', 'generations', 'legality_checks', 'quiet_stages_skipped')
+    full = bench_search(depth, positions, staged_moves=False)
+    staged = bench_search(depth, positions, staged_moves=True)
+    results = []
+    for full_result, staged_result in zip(full['positions'], staged['positions']):
+        result = {'name': full_result['name']}
+        for name, run in (('full', full_result), ('staged', staged_result)):
+            result[name] = {counter: run[counter] for counter in counters}
+            result[name]['time'] = run['time']
+        # Staged nodes count the captures and the quiet moves as a generation each; the one worth
+        # avoiding is the quiet moves, the bulk of every list
+        result['quiet_generations_avoided'] = staged_result['quiet_stages_skipped']
+        result['legality_checks_avoided'] = full_result['legality_checks'] - staged_result['legality_checks']
+        results.append(result)
+    totals = {name: {counter: sum(result[name][counter] for result in results) for counter in counters}
+              for name in ('full', 'staged')}
+    totals['full']['time'], totals['staged']['time'] = full['time'], staged['time']
+    return {'depth': depth, 'positions': results, 'totals': totals,
+            'quiet_generations_avoided': totals['staged']['quiet_stages_skipped'],
+            'legality_checks_avoided': sum(result['legality_checks_avoided'] for result in results),
+            'speedup': round(full['time'] / staged['time'], 3) if staged['time'] else None}
+
+
+def bench_selectivity(depth=4, movetime=1000, positions=BENCH_POSITIONS):
+    # Every feature alone, then all of them, against a plain alpha-beta search: nodes to a fixed
+    # depth, and the depth each position completes within the same time budget
+    configurations = [('none', {})] + [(feature, {feature: True}) for feature in SELECTIVITY_FEATURES] + \
+                     [('all', {feature: True for feature in SELECTIVITY_FEATURES})]
+    report = {'depth': depth, 'movetime': movetime, 'configurations': []}
+    for name, enabled in configurations:
+        options = {feature: enabled.get(feature, False) for feature in SELECTIVITY_FEATURES}
+        fixed = bench_search(depth, positions, **options)
+        depths = {}
+        for position_name, fen in positions.items():
+            searcher = Searcher(**options)
+            searcher.find_best_move(Position.from_fen(fen), max_time_ms=movetime)
+            depths[position_name] = searcher.completed_depth
+        report['configurations'].append({
+            'name': name, 'nodes': fixed['nodes'], 'time': fixed['time'],
+            'moves_matching_none': None,
+            'depth_reached': depths, 'average_depth': round(sum(depths.values()) / len(depths), 2),
+            'moves': {result['name']: result['move'] for result in fixed['positions']}})
+    baseline = report['configurations'][0]['moves']
+    for configuration in report['configurations']:
+        moves = configuration.pop('moves')
+        configuration['moves_matching_none'] = sum(moves[name] == baseline[name] for name in moves)
+    # The features were asked to reach 2 to 3 more plies in the same time
+    extra_depth = round(report['configurations'][-1]['average_depth'] - report['configurations'][0]['average_depth'], 2)
+    report['extra_depth'] = {'all_over_none': extra_depth, 'target': SELECTIVITY_TARGET_PLIES,
+                             'target_met': extra_depth >= SELECTIVITY_TARGET_PLIES[0]}
+    return report
+
+
+def bench_tactics(max_depth=5, positions=TACTICAL_POSITIONS):
+    # For each setting, the shallowest depth that finds every solution and the nodes it took
+    report = {'max_depth': max_depth}
+    for name, options in (('quiescence', {'quiescence': True}), ('plain', {'quiescence': False})):
+        results = []
+        for position_name, (fen, best_moves) in positions.items():
+            for depth in range(1, max_depth + 1):
+                searcher = Searcher(**options)
+                _, move = searcher.find_best_move(Position.from_fen(fen), depth)
+                if move is not None and move_name(move) in best_moves.split():
+                    results.append({'name': position_name, 'depth': depth, 'nodes': searcher.nodes})
+                    break
+            else:
+                results.append({'name': position_name, 'depth': None, 'nodes': None})
+        solved = [result for result in results if result['depth'] is not None]
+        report[name] = {'solved': len(solved), 'positions': results,
+                        'nodes': sum(result['nodes'] for result in solved),
+                        'max_depth_needed': max((result['depth'] for result in solved), default=0)}
+    return report
+
+
+def _exact_depth_searcher(**options):
+    # A serial searcher following the parallel search's table rule, for comparing the two
+    searcher = Searcher(**options)
+    searcher.exact_depth_cutoffs = True
+    return searcher
+
+
+# The features that make the parallel search's results differ from the serial search's
+PARALLEL_OPTIONS = {'null_move': False, 'late_move_reductions': False}
+
+
+def bench_parallel(depth=4, worker_counts=(1, 2, 4), positions=BENCH_POSITIONS):
+    # Both searches leave out the window dependent features and take table cutoffs at the same
+    # depths, so their results have to be identical
+    single = bench_search(depth, positions, searcher_factory=_exact_depth_searcher, **PARALLEL_OPTIONS)
+    report = {'depth': depth, 'cpu_count': os.cpu_count(),
+              'single': {'options': single['options'], 'exact_depth_cutoffs': True, 'nodes': single['nodes'],
+                         'time': single['time']},
+              'parallel': []}
+    for workers in worker_counts:
+        # Start the pool before timing, as a long-running caller would have
+        searcher = ParallelSearcher(workers, **PARALLEL_OPTIONS)
+        searcher.find_best_move(Position.from_fen(STANDARD_POSITIONS['startpos']), 2)
+        run = bench_search(depth, positions, searcher_factory=lambda: searcher)
+        searcher.shutdown()
+        matches = all(a['move'] == b['move'] and a['score'] == b['score']
+                      for a, b in zip(single['positions'], run['positions']))
+        report['parallel'].append({'workers': workers, 'nodes': run['nodes'], 'time': run['time'],
+                                   'speedup': round(single['time'] / run['time'], 3) if run['time'] else 0.0,
+                                   'matches_single': matches})
+    return report
+
+
+def _time_calls(function, arguments):
+    start = time.perf_counter()
+    for args in arguments:
+        function(*args)
+    elapsed = time.perf_counter() - start
+    return {'calls': len(arguments), 'us_per_call': round(elapsed / len(arguments) * 1e6, 3) if arguments else 0.0}
+
+
+def bench_helpers(count=200, seed=1):
+    rng = random.Random(seed)
+    positions = random_positions(count, seed)
+    boards = [(position.to_board(), SIDE_COLORS[position.side], position.castling_rights()) for position in positions]
+    moves = []
+    for board, color, rights in boards:
+        legal = get_legal_moves(board, color, rights)
+        if legal:
+            moves.append((board, rng.choice(legal), rights))
+    return {
+        'get_legal_moves': _time_calls(get_legal_moves, boards),
+        'execute_move': _time_calls(execute_move, moves),
+        'validate_castling': _time_calls(validate_castling, [(board, color, side, rights) for board, color, rights in boards
+                                                             for side in ('kingside', 'queenside')]),
+        'calculate_board_score': _time_calls(calculate_board_score, [(board,) for board, _, _ in boards]),
+    }
+
+
+def verify_scores(count=200, seed=1, plies=40):
+    # Plays random moves on from random_positions and checks the incrementally kept score
+    # (and key) against a full recount after every make_move and every unmake_move
+    rng = random.Random(seed)
+    checks = 0
+    mismatches = []
+
+    def check(position, after):
+        nonlocal checks
+        checks += 1
+        expected = calculate_board_score(position.to_board())
+        if position.score != expected or position.key != position.compute_key():
+            mismatches.append({'fen': position.fen(), 'after': after, 'score': position.score, 'expected': expected})
+
+    for position in random_positions(count, seed):
+        check(position, 'setup')
+        for _ in range(plies):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            move = rng.choice(moves)
+            position.make_move(move)
+            check(position, f"make {move_name(move)}")
+        while position.stack:
+            move = position.stack[-1][0]
+            position.unmake_move()
+            check(position, f"unmake {move_name(move)}")
+    return {'positions': count, 'checks': checks, 'ok': not mismatches, 'mismatches': mismatches[:10]}
+
+
+def bench_perft(depth=3, position_class=Position):
+    results = [dict(run_perft(fen, depth, position_class=position_class), name=name)
+               for name, fen in STANDARD_POSITIONS.items()]
+    nodes = sum(result['nodes'] for result in results)
+    elapsed = sum(result['time'] for result in results)
+    return {'depth': depth, 'positions': results, 'nodes': nodes, 'time': round(elapsed, 6),
+            'nps': int(nodes / elapsed) if elapsed else 0}
+
+
+def bench_backends(perft_depth=3, depth=4, count=200, seed=1, repeat=5):
+    # Every backend has to reach the same perft counts and generate the same moves in the same
+    # order, so that searches agree; the times show what each representation costs in move
+    # generation alone and inside a full search
+    positions = random_positions(count, seed)
+    report = {}
+    move_lists = []
+    search_results = []
+    for name, position_class in POSITION_BACKENDS.items():
+        copies = [position_class(position.board[:], position.side, position.castling) for position in positions]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for position in copies:
+                position.legal_moves()
+            timings.append(time.perf_counter() - start)
+        move_lists.append([position.legal_moves() for position in copies])
+        perft = bench_perft(perft_depth, position_class)
+        search = bench_search(depth, position_class=position_class)
+        report[name] = {'perft': {result['name']: result['nodes'] for result in perft['positions']},
+                        'perft_time': perft['time'], 'perft_nps': perft['nps'],
+                        'legal_moves_us': round(min(timings) / count * 1e6, 3),
+                        'search_nodes': search['nodes'], 'search_time': search['time'], 'search_nps': search['nps']}
+        search_results.append([(result['move'], result['score']) for result in search['positions']])
+    counts = [backend['perft'] for backend in report.values()]
+    report['perft_match'] = all(backend_counts == counts[0] for backend_counts in counts)
+    report['move_order_match'] = all(moves == move_lists[0] for moves in move_lists)
+    report['search_match'] = all(results == search_results[0] for results in search_results)
+    return report
+
+
+def bench_batch(batch_sizes=(1, 8, 32, 128, 512, 2048), seed=1, repeat=5):
+    # Scoring N boards with calculate_board_score one at a time against one vectorised call,
+    # with the array building timed apart; then a node's children, where the search itself
+    # reads the score make_move keeps up to date
+    positions = random_positions(max(batch_sizes), seed)
+    sizes = []
+    for size in batch_sizes:
+        batch = positions[:size]
+        boards = [position.to_board() for position in batch]
+        scalar, stacking, vectorised = [], [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for board in boards:
+                calculate_board_score(board)
+            scalar.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            stacked = stack_boards(batch)
+            stacking.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            evaluate_boards(stacked)
+            vectorised.append(time.perf_counter() - start)
+        sizes.append({'size': size, 'scalar_us': round(min(scalar) / size * 1e6, 3),
+                      'stack_us': round(min(stacking) / size * 1e6, 3),
+                      'batch_us': round(min(vectorised) / size * 1e6, 3),
+                      'speedup': round(min(scalar) / (min(stacking) + min(vectorised)), 2)})
+
+    nodes = [(position, position.legal_moves()) for position in positions[:200]]
+    children = sum(len(moves) for _, moves in nodes)
+    timings = {'scalar': [], 'batch': [], 'incremental': []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for position, moves in nodes:
+            for move in moves:
+                position.make_move(move)
+                calculate_board_score(position.to_board())
+                position.unmake_move()
+        timings['scalar'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for position, moves in nodes:
+            evaluate_children(position, moves)
+        timings['batch'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for position, moves in nodes:
+            for move in moves:
+                position.make_move(move)
+                position.score
+                position.unmake_move()
+        timings['incremental'].append(time.perf_counter() - start)
+    return {'sizes': sizes, 'children': children,
+            'children_us': {name: round(min(runs) / children * 1e6, 3) for name, runs in timings.items()}}
+
+
+def random_game(plies, seed=1):
+    # Random legal moves; a dead end is stepped back from and another move tried
+    rng = random.Random(seed)
+    state = GameState.from_fen()
+    while state.ply < plies:
+        moves = state.position.legal_moves()
+        if not moves:
+            state.takeback()
+            continue
+        state.make_move(rng.choice(moves))
+    return state.moves.tolist()
+
+
+def _traced_bytes(build):
+    # Memory still allocated once build() returns, with the result kept alive
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def bench_history(plies=500, seed=1, samples=200):
+    # Memory of a game's history: a deepcopied board per ply, as the old save_board_state kept
+    # it, against GameState's move log and checkpoints; plus what undo and lookups then cost
+    moves = random_game(plies, seed)
+
+    def deepcopied_boards():
+        position = Position.from_fen(STANDARD_POSITIONS['startpos'])
+        history = []
+        for move in moves:
+            position.make_move(move)
+            history.append(copy.deepcopy(position.to_board()))
+        return history
+
+    def move_log():
+        state = GameState.from_fen()
+        for move in moves:
+            state.make_move(move)
+        return state
+
+    board_bytes, _ = _traced_bytes(deepcopied_boards)
+    log_bytes, state = _traced_bytes(move_log)
+    rng = random.Random(seed)
+    plies_to_rebuild = [rng.randrange(len(moves) + 1) for _ in range(samples)]
+    start = time.perf_counter()
+    for ply in plies_to_rebuild:
+        state.position_at(ply)
+    rebuild_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(len(moves)):
+        state.takeback()
+    state.redo(len(moves))
+    undo_time = time.perf_counter() - start
+    start = time.perf_counter()
+    state.pgn()
+    pgn_time = time.perf_counter() - start
+    return {'plies': len(moves),
+            'deepcopied_boards_bytes': board_bytes, 'move_log_bytes': log_bytes,
+            'deepcopied_boards_bytes_per_ply': round(board_bytes / len(moves), 1),
+            'move_log_bytes_per_ply': round(log_bytes / len(moves), 1),
+            'ratio': round(board_bytes / log_bytes, 2) if log_bytes else 0.0,
+            'position_at_us': round(rebuild_time / samples * 1e6, 3),
+            'takeback_and_redo_us_per_ply': round(undo_time / len(moves) / 2 * 1e6, 3),
+            'pgn_export_ms': round(pgn_time * 1000, 3)}
+
+
+def bench_uci_startup(movetime=100, repeat=3):
+    # Wall time from launching uci.py to its first replies, as a tournament manager sees it
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uci.py')
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        engine = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                  text=True, bufsize=1)
+        timings = {}
+        for command, reply, name in (('uci', 'uciok', 'uciok'), ('isready', 'readyok', 'readyok'),
+                                     (f'position startpos\ngo movetime {movetime}', 'bestmove', 'first_move')):
+            engine.stdin.write(command + '\n')
+            engine.stdin.flush()
+            while not engine.stdout.readline().startswith(reply):
+                pass
+            timings[name] = round((time.perf_counter() - start) * 1000, 3)
+        engine.stdin.write('quit\n')
+        engine.stdin.flush()
+        engine.wait()
+        runs.append(timings)
+    return {'movetime': movetime, 'runs': runs,
+            'best': {name: min(run[name] for run in runs) for name in runs[0]}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Engine benchmarks; every command prints one JSON document")
+    parser.add_argument('--depth', type=int, default=4, help="search depth for the search benchmark")
+    parser.add_argument('--perft-depth', type=int, default=3)
+    parser.add_argument('--positions', type=int, default=200, help="random positions for the micro-benchmarks")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('command', nargs='?', default='all', choices=['all', 'search', 'perft', 'helpers', 'attacks', 'ordering', 'parallel', 'uci', 'tactics', 'selectivity', 'history', 'backends', 'batch', 'staged', 'score'])
+    parser.add_argument('--movetime', type=int, default=1000, help="time per position for the selectivity benchmark")
+    parser.add_argument('--plies', type=int, default=500, help="game length for the history benchmark")
+    parser.add_argument('--workers', default='1,2,4', help="comma separated worker counts for the parallel benchmark")
+    parser.add_argument('--stats', action='store_true', help="add per-iteration search statistics to the search benchmark")
+    parser.add_argument('--info', action='store_true', help="print UCI style info lines on stderr while searching")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], help="profile the benchmark and write a report")
+    parser.add_argument('--profile-output', help="file for the profile report (default: stderr)")
+    args = parser.parse_args()
+
+    if args.profile:
+        report = profile_call(run_benchmarks, args, mode=args.profile, output=args.profile_output)
+    else:
+        report = run_benchmarks(args)
+    print(json.dumps(report, indent=2))
+    if 'score' in report and not report['score']['ok']:
+        raise SystemExit(1)
+
+
+def run_benchmarks(args):
+    report = {}
+    if args.command in ('all', 'search'):
+        report['search'] = bench_search(args.depth, stats=args.stats, info=print_info if args.info else None)
+    if args.command in ('all', 'perft'):
+        report['perft'] = bench_perft(args.perft_depth)
+    if args.command in ('all', 'helpers'):
+        report['helpers'] = bench_helpers(args.positions, args.seed)
+    if args.command == 'ordering':
+        report['ordering'] = bench_ordering(args.depth)
+    if args.command == 'parallel':
+        report['parallel'] = bench_parallel(args.depth, [int(count) for count in args.workers.split(',')])
+    if args.command == 'attacks':
+        report['attacks'] = bench_attacks(args.positions, args.seed, args.repeat)
+    if args.command == 'tactics':
+        report['tactics'] = bench_tactics(args.depth)
+    if args.command == 'selectivity':
+        report['selectivity'] = bench_selectivity(args.depth, args.movetime)
+    if args.command == 'history':
+        report['history'] = bench_history(args.plies, args.seed)
+    if args.command == 'backends':
+        report['backends'] = bench_backends(args.perft_depth, args.depth, args.positions, args.seed, args.repeat)
+    if args.command == 'score':
+        report['score'] = verify_scores(args.positions, args.seed)
+    if args.command == 'staged':
+        report['staged'] = bench_staged(args.depth)
+    if args.command == 'batch':
+        report['batch'] = bench_batch(seed=args.seed, repeat=args.repeat)
+    if args.command == 'uci':
+        report['uci'] = bench_uci_startup(repeat=args.repeat)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+from position import Position, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, KING_HOMES, \
+    WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, KNIGHT_TARGETS, KING_TARGETS, \
+    PAWN_ATTACKERS, ALL_SQUARES
+
+# Bit sq stands for square sq, so row 0 (rank 8) is the low byte and a white pawn moves
+# towards the low bits: a push is >> 8, a black pawn's push << 8.
+FILE_A = sum(1 << row * 8 for row in range(8))
+FILE_H = FILE_A << 7
+ROWS = [0xff << row * 8 for row in range(8)]
+# The row a pawn makes a double push from
+START_ROWS = {1: ROWS[6], -1: ROWS[1]}
+
+
+def _mask(squares):
+    mask = 0
+    for sq in squares:
+        mask |= 1 << sq
+    return mask
+
+
+def _ray_masks(dr, dc):
+    masks = []
+    for sq in range(64):
+        mask = 0
+        row, col = (sq >> 3) + dr, (sq & 7) + dc
+        while 0 <= row < 8 and 0 <= col < 8:
+            mask |= 1 << row * 8 + col
+            row, col = row + dr, col + dc
+        masks.append(mask)
+    return masks
+
+
+KNIGHT_ATTACKS = [_mask(targets) for targets in KNIGHT_TARGETS]
+KING_ATTACKS = [_mask(targets) for targets in KING_TARGETS]
+# Squares a pawn of the given side has to stand on to attack a square
+PAWN_ATTACKER_MASKS = {side: [_mask(origins) for origins in PAWN_ATTACKERS[side]] for side in (1, -1)}
+
+# Classical ray attacks: a ray towards higher squares stops at its lowest blocker, a ray
+# towards lower squares at its highest, and the blocker's own ray is cut off beyond it
+BISHOP_UP = [_ray_masks(1, 1), _ray_masks(1, -1)]
+BISHOP_DOWN = [_ray_masks(-1, 1), _ray_masks(-1, -1)]
+ROOK_UP = [_ray_masks(1, 0), _ray_masks(0, 1)]
+ROOK_DOWN = [_ray_masks(-1, 0), _ray_masks(0, -1)]
+BISHOP_LINES = [BISHOP_UP[0][sq] | BISHOP_UP[1][sq] | BISHOP_DOWN[0][sq] | BISHOP_DOWN[1][sq] for sq in range(64)]
+ROOK_LINES = [ROOK_UP[0][sq] | ROOK_UP[1][sq] | ROOK_DOWN[0][sq] | ROOK_DOWN[1][sq] for sq in range(64)]
+
+
+def _between():
+    # Squares strictly between two squares on a common line, 0 when they share none
+    table = [[0] * 64 for _ in range(64)]
+    for rays in (BISHOP_UP, BISHOP_DOWN, ROOK_UP, ROOK_DOWN):
+        for masks in rays:
+            for sq in range(64):
+                ray = masks[sq]
+                while ray:
+                    bit = ray & -ray
+                    target = bit.bit_length() - 1
+                    table[sq][target] = masks[sq] & ~masks[target] & ~bit
+                    ray ^= bit
+    return table
+
+
+BETWEEN = _between()
+
+
+def _slide(up, down, sq, occupied):
+    # up and down each hold two rays, unrolled since this is the inner loop of every attack test
+    ray = up[0][sq]
+    blockers = ray & occupied
+    attacks = ray ^ up[0][(blockers & -blockers).bit_length() - 1] if blockers else ray
+    ray = up[1][sq]
+    blockers = ray & occupied
+    attacks |= ray ^ up[1][(blockers & -blockers).bit_length() - 1] if blockers else ray
+    ray = down[0][sq]
+    blockers = ray & occupied
+    attacks |= ray ^ down[0][blockers.bit_length() - 1] if blockers else ray
+    ray = down[1][sq]
+    blockers = ray & occupied
+    attacks |= ray ^ down[1][blockers.bit_length() - 1] if blockers else ray
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    return _slide(BISHOP_UP, BISHOP_DOWN, sq, occupied)
+
+
+def rook_attacks(sq, occupied):
+    return _slide(ROOK_UP, ROOK_DOWN, sq, occupied)
+
+
+# How far each kind of pawn move goes back from its origin, by side, in the order Position
+# tries a pawn's moves: push, double push, then the capture towards the a-file before the other
+PAWN_ORIGINS = {1: (8, 16, 9, 7), -1: (-8, -16, -7, -9)}
+
+
+def _slider_lines(rays):
+    # Per square, the rays with at least one square on the board, each as (squares, ray masks,
+    # whether it runs towards higher squares), in the order of SLIDER_RAYS
+    return [tuple((masks[sq], masks, up) for masks, up in rays if masks[sq]) for sq in range(64)]
+
+
+_BISHOP_RAYS = ((BISHOP_UP[0], True), (BISHOP_UP[1], True), (BISHOP_DOWN[0], False), (BISHOP_DOWN[1], False))
+_ROOK_RAYS = ((ROOK_UP[0], True), (ROOK_DOWN[0], False), (ROOK_UP[1], True), (ROOK_DOWN[1], False))
+SLIDER_LINES = {BISHOP: _slider_lines(_BISHOP_RAYS), ROOK: _slider_lines(_ROOK_RAYS),
+                QUEEN: _slider_lines(_BISHOP_RAYS + _ROOK_RAYS)}
+# Every square on a slider's rays, to pass over sliders with nothing to move to at once
+SLIDER_REACH = {BISHOP: BISHOP_LINES, ROOK: ROOK_LINES, QUEEN: [BISHOP_LINES[sq] | ROOK_LINES[sq] for sq in range(64)]}
+
+
+def pawn_movers(pawns, side, empty, enemy, allowed):
+    # The pawns with a push, double push, a-file side capture and other capture landing on
+    # allowed, found by moving the target sets back onto the pawns
+    empty_allowed = empty & allowed
+    enemy_allowed = enemy & allowed
+    if side == 1:
+        return (pawns & empty_allowed << 8, pawns & START_ROWS[1] & empty << 8 & empty_allowed << 16,
+                pawns & ~FILE_A & enemy_allowed << 9, pawns & ~FILE_H & enemy_allowed << 7)
+    return (pawns & empty_allowed >> 8, pawns & START_ROWS[-1] & empty >> 8 & empty_allowed >> 16,
+            pawns & ~FILE_A & enemy_allowed >> 7, pawns & ~FILE_H & enemy_allowed >> 9)
+
+
+class BitboardPosition(Position):
+    # Position with twelve piece bitboards and per side occupancy kept next to the board list.
+    # The board still answers "what is on this square" for evaluation, ordering and SEE, while
+    # attack tests and move generation work on whole sets of squares.
+    __slots__ = ('bitboards', 'colors')
+
+    def __init__(self, board, side=1, castling=0):
+        super().__init__(board, side, castling)
+        self.compute_bitboards()
+
+    def compute_bitboards(self):
+        # Laid out like the piece tables, so bitboards[piece] works for black codes too,
+        # and colors[side] likewise for side 1 and -1
+        self.bitboards = [0] * 13
+        self.colors = [0, 0, 0]
+        for sq, piece in enumerate(self.board):
+            if piece:
+                self.bitboards[piece] |= 1 << sq
+                self.colors[1 if piece > 0 else -1] |= 1 << sq
+
+    def copy(self):
+        position = BitboardPosition.__new__(BitboardPosition)
+        position.board = self.board[:]
+        position.side = self.side
+        position.castling = self.castling
+        position.kings = dict(self.kings)
+        position.pieces = self.pieces
+        position.key = self.key
+        position.score = self.score
+        position.stack = []
+        position.bitboards = self.bitboards[:]
+        position.colors = self.colors[:]
+        return position
+
+    def toggle(self, piece, captured, corner, start, end):
+        # XORs a move in or out of the bitboards; its own inverse. corner is the piece a
+        # castling king's rook came from, of either colour as in make_move
+        bitboards = self.bitboards
+        colors = self.colors
+        side = 1 if piece > 0 else -1
+        squares = 1 << start | 1 << end
+        bitboards[piece] ^= squares
+        colors[side] ^= squares
+        if captured:
+            bitboards[captured] ^= 1 << end
+            colors[-side] ^= 1 << end
+        if corner:
+            corner_sq, rook_sq = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+            bitboards[corner] ^= 1 << corner_sq
+            colors[1 if corner > 0 else -1] ^= 1 << corner_sq
+            bitboards[ROOK * side] ^= 1 << rook_sq
+            colors[side] ^= 1 << rook_sq
+
+    def make_move(self, move):
+        board = self.board
+        start, end = move & 63, move >> 6 & 63
+        piece = board[start]
+        captured = board[end]
+        Position.make_move(self, move)
+        corner = self.stack[-1][3]
+        if captured or corner:
+            self.toggle(piece, captured, corner, start, end)
+        else:
+            # Most moves only shift their own piece, done here without the call
+            squares = 1 << start | 1 << end
+            self.bitboards[piece] ^= squares
+            self.colors[-self.side] ^= squares
+
+    def unmake_move(self):
+        move, captured, _, corner, _, _ = self.stack[-1]
+        start, end = move & 63, move >> 6 & 63
+        piece = self.board[end]
+        if captured or corner:
+            self.toggle(piece, captured, corner, start, end)
+        else:
+            squares = 1 << start | 1 << end
+            self.bitboards[piece] ^= squares
+            self.colors[-self.side] ^= squares
+        Position.unmake_move(self)
+
+    def attackers(self, sq, by_side, occupied):
+        bitboards = self.bitboards
+        found = (PAWN_ATTACKER_MASKS[by_side][sq] & bitboards[PAWN * by_side]
+                 | KNIGHT_ATTACKS[sq] & bitboards[KNIGHT * by_side]
+                 | KING_ATTACKS[sq] & bitboards[KING * by_side])
+        # Rays are only traced when a slider stands somewhere on their lines
+        queens = bitboards[QUEEN * by_side]
+        sliders = BISHOP_LINES[sq] & (bitboards[BISHOP * by_side] | queens)
+        if sliders:
+            found |= bishop_attacks(sq, occupied) & sliders
+        sliders = ROOK_LINES[sq] & (bitboards[ROOK * by_side] | queens)
+        if sliders:
+            found |= rook_attacks(sq, occupied) & sliders
+        return found
+
+    def is_attacked(self, sq, by_side):
+        # attackers cut short at the first piece found, cheapest tests first
+        bitboards = self.bitboards
+        if (PAWN_ATTACKER_MASKS[by_side][sq] & bitboards[PAWN * by_side]
+                or KNIGHT_ATTACKS[sq] & bitboards[KNIGHT * by_side]
+                or KING_ATTACKS[sq] & bitboards[KING * by_side]):
+            return True
+        queens = bitboards[QUEEN * by_side]
+        occupied = self.colors[1] | self.colors[-1]
+        sliders = BISHOP_LINES[sq] & (bitboards[BISHOP * by_side] | queens)
+        if sliders and bishop_attacks(sq, occupied) & sliders:
+            return True
+        sliders = ROOK_LINES[sq] & (bitboards[ROOK * by_side] | queens)
+        return bool(sliders and rook_attacks(sq, occupied) & sliders)
+
+    def can_castle(self, side, kingside):
+        # Same rule as the board version: right kept, king home, a rook of either colour in the
+        # corner, nothing between, and the king neither in nor passing through check
+        bit = (WHITE_KINGSIDE if kingside else WHITE_QUEENSIDE) if side == 1 else \
+              (BLACK_KINGSIDE if kingside else BLACK_QUEENSIDE)
+        if not self.castling & bit:
+            return False
+        bitboards = self.bitboards
+        home = KING_HOMES[side]
+        corner = home + 3 if kingside else home - 4
+        if not (bitboards[KING] | bitboards[-KING]) >> home & 1 or not (bitboards[ROOK] | bitboards[-ROOK]) >> corner & 1:
+            return False
+        occupied = self.colors[1] | self.colors[-1]
+        if BETWEEN[home][corner] & occupied:
+            return False
+        step = 1 if kingside else -1
+        for sq in (home, home + step, home + 2 * step):
+            if self.attackers(sq, -side, occupied):
+                return False
+        return True
+
+    def checks_and_pins(self):
+        # (checkers, check_mask, pin_masks) as in Position, found with set operations
+        bitboards = self.bitboards
+        side = self.side
+        enemy = -side
+        king = self.kings[side]
+        own = self.colors[side]
+        occupied = own | self.colors[enemy]
+        checkers = self.attackers(king, enemy, occupied)
+        check_mask = ALL_SQUARES
+        count = 0
+        if checkers:
+            count = 2 if checkers & checkers - 1 else 1
+            if count == 1:
+                check_mask = checkers | BETWEEN[king][checkers.bit_length() - 1]
+        pin_masks = {}
+        queens = bitboards[QUEEN * enemy]
+        sliders = (BISHOP_LINES[king] & (bitboards[BISHOP * enemy] | queens)
+                   | ROOK_LINES[king] & (bitboards[ROOK * enemy] | queens))
+        while sliders:
+            bit = sliders & -sliders
+            sliders ^= bit
+            between = BETWEEN[king][bit.bit_length() - 1]
+            blockers = between & occupied
+            if blockers and not blockers & blockers - 1 and blockers & own:
+                pin_masks[blockers.bit_length() - 1] = between | bit
+        return count, check_mask, pin_masks
+
+    def generate(self, captures, quiets):
+        # Legal moves landing on enemy pieces, on empty squares, or both. The pieces are taken
+        # by square and each one's targets in the order Position tries them, so the list matches
+        # Position.legal_moves move for move and ties in move ordering go the same way
+        board = self.board
+        bitboards = self.bitboards
+        side = self.side
+        king = self.kings[side]
+        if king is None:
+            return []
+        own = self.colors[side]
+        enemy = self.colors[-side]
+        occupied = own | enemy
+        empty = ALL_SQUARES & ~occupied if quiets else 0
+        if not captures:
+            enemy = 0
+        targets = enemy | empty
+        king_targets = KING_ATTACKS[king] & targets
+        checkers, check_mask, pin_masks = self.checks_and_pins()
+        targets &= check_mask
+
+        pinned = 0
+        for sq in pin_masks:
+            pinned |= 1 << sq
+        pawns = bitboards[PAWN * side]
+        singles, doubles, lefts, rights = pawn_movers(pawns & ~pinned, side, empty, enemy, check_mask)
+        for sq, pin_mask in pin_masks.items():
+            if pawns >> sq & 1:
+                pinned_singles, pinned_doubles, pinned_lefts, pinned_rights = \
+                    pawn_movers(1 << sq, side, empty, enemy, check_mask & pin_mask)
+                singles |= pinned_singles
+                doubles |= pinned_doubles
+                lefts |= pinned_lefts
+                rights |= pinned_rights
+        push, double_push, left, right = PAWN_ORIGINS[side]
+
+        moves = []
+        append = moves.append
+        # Pawns without a move are passed over, and in double check only the king can move
+        pieces = own & ~pawns | singles | doubles | lefts | rights if checkers < 2 else 1 << king
+        while pieces:
+            bit = pieces & -pieces
+            pieces ^= bit
+            sq = bit.bit_length() - 1
+            piece = board[sq] * side
+            if piece == PAWN:
+                if singles & bit:
+                    append(sq | (sq - push) << 6)
+                if doubles & bit:
+                    append(sq | (sq - double_push) << 6)
+                if lefts & bit:
+                    append(sq | (sq - left) << 6)
+                if rights & bit:
+                    append(sq | (sq - right) << 6)
+            elif piece == KNIGHT:
+                found = KNIGHT_ATTACKS[sq] & targets
+                if found and not bit & pinned:
+                    for end in KNIGHT_TARGETS[sq]:
+                        if found >> end & 1:
+                            append(sq | end << 6)
+            elif piece == KING:
+                if king_targets:
+                    # attackers inlined, with the enemy sets taken once for every target
+                    without_king = occupied ^ bit
+                    pawn_masks = PAWN_ATTACKER_MASKS[-side]
+                    enemy_pawns = bitboards[-PAWN * side]
+                    enemy_knights = bitboards[-KNIGHT * side]
+                    enemy_king = bitboards[-KING * side]
+                    enemy_queens = bitboards[-QUEEN * side]
+                    diagonal = bitboards[-BISHOP * side] | enemy_queens
+                    straight = bitboards[-ROOK * side] | enemy_queens
+                    for end in KING_TARGETS[sq]:
+                        if not king_targets >> end & 1:
+                            continue
+                        if (pawn_masks[end] & enemy_pawns or KNIGHT_ATTACKS[end] & enemy_knights
+                                or KING_ATTACKS[end] & enemy_king):
+                            continue
+                        sliders = BISHOP_LINES[end] & diagonal
+                        if sliders and bishop_attacks(end, without_king) & sliders:
+                            continue
+                        sliders = ROOK_LINES[end] & straight
+                        if sliders and rook_attacks(end, without_king) & sliders:
+                            continue
+                        append(sq | end << 6)
+                if not checkers and quiets and sq == KING_HOMES[side]:
+                    if self.can_castle(side, True):
+                        append(sq | (sq + 2) << 6)
+                    if self.can_castle(side, False):
+                        append(sq | (sq - 2) << 6)
+            else:
+                allowed = targets & pin_masks[sq] if bit & pinned else targets
+                if not SLIDER_REACH[piece][sq] & allowed:
+                    continue
+                # Each ray is walked outwards from the slider, up to and including a blocker
+                for ray, masks, up in SLIDER_LINES[piece][sq]:
+                    if not ray & allowed:
+                        continue
+                    blockers = ray & occupied
+                    if up:
+                        if blockers:
+                            ray ^= masks[(blockers & -blockers).bit_length() - 1]
+                        ray &= allowed
+                        while ray:
+                            end_bit = ray & -ray
+                            ray ^= end_bit
+                            append(sq | (end_bit.bit_length() - 1) << 6)
+                    else:
+                        if blockers:
+                            ray ^= masks[blockers.bit_length() - 1]
+                        ray &= allowed
+                        while ray:
+                            end = ray.bit_length() - 1
+                            ray ^= 1 << end
+                            append(sq | end << 6)
+        return moves
+
+    def legal_moves(self):
+        return self.generate(True, True)
+
+    def legal_captures(self):
+        return self.generate(True, False)
+
+    def legal_quiets(self):
+        return self.generate(False, True)
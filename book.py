@@ -0,0 +1,78 @@
+import mmap
+import os
+import random
+import struct
+
+# Polyglot layout: sorted 16-byte big-endian entries of key, move, weight and a
+# learn field. Keys are this engine's Zobrist keys and moves are encoded as
+# from | to << 6, so books are built with build_book.py rather than taken from
+# other engines.
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+MAX_WEIGHT = 0xffff
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        # mmap refuses empty files, and an empty book simply never answers
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.count = size // ENTRY.size
+
+    def key_at(self, index):
+        return KEY.unpack_from(self.data, index * ENTRY.size)[0]
+
+    def entries(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        for index in range(low, self.count):
+            entry_key, move, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append((move, weight))
+        return entries
+
+    def choose(self, position, policy='weighted', rng=random):
+        # Hash collisions are possible, so book moves are only trusted when they are legal here
+        legal = set(position.legal_moves())
+        entries = [(move, weight) for move, weight in self.entries(position.key) if move in legal and weight]
+        if not entries:
+            return None
+        if policy == 'best':
+            return max(entries, key=lambda entry: entry[1])[0]
+        return rng.choices([move for move, _ in entries], [weight for _, weight in entries])[0]
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+
+def write_book(path, weights):
+    # weights maps (key, move) to a count; counts are scaled into the 16-bit weight field
+    top = max(weights.values(), default=0)
+    scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+    with open(path, 'wb') as book:
+        for (key, move), weight in sorted(weights.items()):
+            weight = int(weight * scale)
+            if weight:
+                book.write(ENTRY.pack(key, move, weight, 0))
+
+
+_opening_books = {}
+
+def get_opening_book(path):
+    # Opened once per path; returns None if no book has been built. A missing book is not
+    # remembered, so one built later is picked up on the next call
+    book = _opening_books.get(path)
+    if book is None and os.path.exists(path):
+        book = _opening_books[path] = OpeningBook(path)
+    return book
@@ -0,0 +1,126 @@
+import argparse
+import json
+import random
+import re
+from engine import *
+from book import OpeningBook, write_book
+from position import Position, move_name, parse_san
+
+BOOK_PLIES = 20
+# Polyglot convention: moves by the winner count 2, drawn games 1, the loser's moves 0
+RESULT_WEIGHTS = {'1-0': {1: 2, -1: 0}, '0-1': {1: 0, -1: 2}, '1/2-1/2': {1: 1, -1: 1}, '*': {1: 1, -1: 1}}
+
+
+def start_position():
+    return Position.from_board(STARTING_BOARD, 'w', reset_castling_rights())
+
+
+def read_pgn_games(lines):
+    # Yields (result, [san, ...]) for every game; comments, variations and NAGs are dropped
+    result, movetext = '*', []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            if movetext:
+                yield result, _san_tokens(' '.join(movetext))
+                result, movetext = '*', []
+            match = re.match(r'\[Result "(.*)"\]', line)
+            if match:
+                result = match.group(1)
+        elif line and not line.startswith('%'):
+            movetext.append(line)
+    if movetext:
+        yield result, _san_tokens(' '.join(movetext))
+
+
+def _san_tokens(text):
+    text = re.sub(r'\{[^}]*\}|;[^\n]*|\$\d+', ' ', text)
+    while '(' in text:
+        text = re.sub(r'\([^()]*\)', ' ', text)
+    tokens = []
+    for token in text.split():
+        token = re.sub(r'^\d+\.+', '', token)
+        if token and token not in RESULT_WEIGHTS:
+            tokens.append(token)
+    return tokens
+
+
+def add_pgn_game(weights, result, sans, max_plies=BOOK_PLIES):
+    position = start_position()
+    side_weights = RESULT_WEIGHTS.get(result, RESULT_WEIGHTS['*'])
+    plies = 0
+    for san in sans[:max_plies]:
+        move = parse_san(position, san)
+        # Stops at anything these rules cannot reproduce, such as en passant or promotion
+        if move is None:
+            break
+        weights[position.key, move] = weights.get((position.key, move), 0) + side_weights[position.side]
+        position.make_move(move)
+        plies += 1
+    return plies
+
+
+def self_play_game(searcher, rng, depth=DEFAULT_SEARCH_DEPTH, max_plies=BOOK_PLIES, random_plies=2):
+    # A few random opening plies give the games variety; the engine plays the rest
+    position = start_position()
+    moves = []
+    for ply in range(max_plies):
+        legal = position.legal_moves()
+        if not legal:
+            break
+        if ply < random_plies:
+            move = rng.choice(legal)
+        else:
+            _, move = searcher.find_best_move(position, depth)
+            if move is None:
+                break
+        moves.append((position.key, move))
+        position.make_move(move)
+    return moves
+
+
+def build(pgn_files=(), self_play=0, depth=DEFAULT_SEARCH_DEPTH, max_plies=BOOK_PLIES, random_plies=2, seed=1):
+    weights = {}
+    games = plies = 0
+    for path in pgn_files:
+        with open(path) as pgn:
+            for result, sans in read_pgn_games(pgn):
+                plies += add_pgn_game(weights, result, sans, max_plies)
+                games += 1
+    searcher = Searcher()
+    rng = random.Random(seed)
+    for _ in range(self_play):
+        for key, move in self_play_game(searcher, rng, depth, max_plies, random_plies):
+            weights[key, move] = weights.get((key, move), 0) + 1
+            plies += 1
+        games += 1
+    return weights, {'games': games, 'plies': plies, 'entries': len(weights),
+                     'positions': len({key for key, _ in weights})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an opening book from PGN files and/or engine self-play")
+    parser.add_argument('pgn', nargs='*', help="PGN files to read")
+    parser.add_argument('-o', '--output', default=OPENING_BOOK_PATH)
+    parser.add_argument('--self-play', type=int, default=0, help="number of self-play games to add")
+    parser.add_argument('--depth', type=int, default=DEFAULT_SEARCH_DEPTH, help="search depth for self-play moves")
+    parser.add_argument('--plies', type=int, default=BOOK_PLIES, help="book moves kept per game")
+    parser.add_argument('--random-plies', type=int, default=2, help="random moves opening each self-play game")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--probe', metavar='FEN', help="list the book moves for a position instead of building")
+    args = parser.parse_args()
+
+    if args.probe:
+        book = OpeningBook(args.output)
+        entries = book.entries(Position.from_fen(args.probe).key)
+        print(json.dumps([{'move': move_name(move), 'weight': weight} for move, weight in entries], indent=2))
+        book.close()
+        return
+    weights, summary = build(args.pgn, args.self_play, args.depth, args.plies, args.random_plies, args.seed)
+    write_book(args.output, weights)
+    summary['output'] = args.output
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,17 @@ DARK_SQUARE = (0, 100, 0)
 HIGHLIGHT = (247, 247, 105)
 MOVE_HIGHLIGHT = (124, 252, 0)
 
+DEFAULT_SEARCH_DEPTH = 3
+MAX_SEARCH_DEPTH = 64
+LIMIT_CHECK_INTERVAL = 256
+AI_MOVE_TIME_MS = 1000
+OPENING_BOOK_PATH = 'chess/book.bin'
+BOOK_POLICY = 'weighted'
+ENDGAME_TABLE_PATH = 'chess/tables'
+PGN_PATH = 'game.pgn'
+# Board representation used by the engine: 'mailbox' or 'bitboard'
+POSITION_BACKEND = 'mailbox'
+
 PIECE_IMAGES = {
     'P': 'chess/pieces/white_pawn.png',
     'N': 'chess/pieces/white_knight.png',
@@ -98,9 +109,4 @@ KING_POSITION_VALUES = [
         [-1, -2, -2, -2, -2, -2, -2, -1],
         [2,   2,  0,  0,  0,  0,  2,  2],
         [2,   3,  1,  0,  0,  1,  3,  2],
-]
-
-castling_rights = {
-    'w': {'kingside':True, 'queenside':True},
-    'b': {'kingside': True, 'queenside': True}
-}
\ No newline at end of file
+]
\ No newline at end of file
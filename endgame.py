@@ -0,0 +1,222 @@
+import argparse
+import json
+import mmap
+import os
+import time
+from constants import ENDGAME_TABLE_PATH
+from position import Position, EMPTY, PAWN, KING, PIECE_CHARS, PIECE_CODES, KING_TARGETS
+
+TABLE_SIGNATURES = ('KQvK', 'KRvK', 'KPvK')
+TABLE_PIECES = 3
+WIN_SCORE = 1000
+
+# One byte per position from the side to move's view: 0 is a draw (or a placement
+# that cannot occur), WIN + n a win and LOSS + n a loss, n plies from mate
+DRAW, WIN, LOSS = 0, 1, 128
+
+
+def _king_squares(pawns):
+    # Symmetry: the strong king is kept on files a-d, and without pawns on ranks 1-4 too
+    rows = range(8) if pawns else range(4, 8)
+    return [row * 8 + col for row in rows for col in range(4)]
+
+
+KING_INDEXES = {pawns: {sq: index for index, sq in enumerate(_king_squares(pawns))} for pawns in (False, True)}
+
+
+def table_size(pawns):
+    return len(KING_INDEXES[pawns]) * 64 * 64 * 2
+
+
+def table_index(strong_king, weak_king, piece, strong_to_move, pawns):
+    # Squares are seen from the strong side, as if it were white
+    if strong_king & 7 > 3:
+        strong_king, weak_king, piece = strong_king ^ 7, weak_king ^ 7, piece ^ 7
+    if not pawns and strong_king >> 3 < 4:
+        strong_king, weak_king, piece = strong_king ^ 56, weak_king ^ 56, piece ^ 56
+    return ((KING_INDEXES[pawns][strong_king] * 64 + weak_king) * 64 + piece) * 2 + (0 if strong_to_move else 1)
+
+
+def generate_table(signature):
+    # Retrograde analysis: mates are found with the engine's own move generator, then
+    # results spread backwards one ply at a time through the recorded predecessors
+    piece = PIECE_CODES[signature[1]]
+    pawns = piece == PAWN
+    size = table_size(pawns)
+    values = bytearray(size)
+    remaining = [0] * size
+    predecessors = [[] for _ in range(size)]
+    position = Position([EMPTY] * 64)
+    board = position.board
+    frontier = []
+    for strong_king in KING_INDEXES[pawns]:
+        for weak_king in range(64):
+            if weak_king == strong_king or weak_king in KING_TARGETS[strong_king]:
+                continue
+            for piece_sq in range(64):
+                if piece_sq in (strong_king, weak_king) or (pawns and piece_sq >> 3 == 7):
+                    continue
+                board[strong_king], board[weak_king], board[piece_sq] = KING, -KING, piece
+                position.kings = {1: strong_king, -1: weak_king}
+                for side in (1, -1):
+                    position.side = side
+                    if position.is_attacked(position.kings[-side], side):
+                        continue
+                    index = table_index(strong_king, weak_king, piece_sq, side == 1, pawns)
+                    moves = position.legal_moves()
+                    remaining[index] = len(moves)
+                    if not moves and position.in_check():
+                        values[index] = LOSS
+                        frontier.append(index)
+                    for move in moves:
+                        start, end = move & 63, move >> 6 & 63
+                        if end == piece_sq:
+                            # Capturing the last piece draws, and that move is never lost
+                            continue
+                        if start == strong_king:
+                            child = table_index(end, weak_king, piece_sq, False, pawns)
+                        elif start == weak_king:
+                            child = table_index(strong_king, end, piece_sq, True, pawns)
+                        else:
+                            child = table_index(strong_king, weak_king, end, False, pawns)
+                        predecessors[child].append(index)
+                board[strong_king] = board[weak_king] = board[piece_sq] = EMPTY
+
+    plies = 0
+    while frontier:
+        plies += 1
+        if LOSS + plies > 0xff:
+            raise ValueError(f"{signature}: distance to mate does not fit the table format")
+        next_frontier = []
+        for index in frontier:
+            lost = values[index] >= LOSS
+            for parent in predecessors[index]:
+                if values[parent]:
+                    continue
+                if lost:
+                    values[parent] = WIN + plies
+                    next_frontier.append(parent)
+                else:
+                    remaining[parent] -= 1
+                    if not remaining[parent]:
+                        values[parent] = LOSS + plies
+                        next_frontier.append(parent)
+        frontier = next_frontier
+    return values
+
+
+def table_score(value):
+    if value == DRAW:
+        return 0
+    if value < LOSS:
+        return WIN_SCORE - (value - WIN)
+    return -(WIN_SCORE - (value - LOSS))
+
+
+class EndgameTables:
+    def __init__(self, path=ENDGAME_TABLE_PATH):
+        self.tables = {}
+        self.files = []
+        for signature in TABLE_SIGNATURES:
+            file_path = os.path.join(path, signature + '.bin')
+            if not os.path.exists(file_path):
+                continue
+            table_file = open(file_path, 'rb')
+            self.files.append(table_file)
+            self.tables[signature] = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.probes = self.hits = 0
+
+    def probe(self, position):
+        # Exact score from the side to move's view, or None when no table covers the position
+        self.probes += 1
+        if position.pieces == 2:
+            self.hits += 1
+            return 0
+        if position.pieces != TABLE_PIECES or position.castling:
+            return None
+        board = position.board
+        for sq in range(64):
+            piece = board[sq]
+            if piece and piece != KING and piece != -KING:
+                break
+        strong = 1 if piece > 0 else -1
+        table = self.tables.get('K' + PIECE_CHARS[abs(piece)] + 'vK')
+        if table is None:
+            return None
+        strong_king, weak_king = position.kings[strong], position.kings[-strong]
+        if strong == -1:
+            strong_king, weak_king, sq = strong_king ^ 56, weak_king ^ 56, sq ^ 56
+        self.hits += 1
+        return table_score(table[table_index(strong_king, weak_king, sq, position.side == strong, abs(piece) == PAWN)])
+
+    def best_move(self, position):
+        # (score, move) for the move the tables rate best, ties going to generation order
+        moves = position.legal_moves()
+        if not moves or position.pieces > TABLE_PIECES:
+            return None
+        best = None
+        for move in moves:
+            position.make_move(move)
+            score = self.probe(position)
+            position.unmake_move()
+            if score is None:
+                return None
+            if best is None or -score > best[0]:
+                best = (-score, move)
+        # The child scores are one ply away from the root's own entry
+        return self.probe(position), best[1]
+
+    def best_line(self, position, plies):
+        line = []
+        for _ in range(plies):
+            result = self.best_move(position)
+            if result is None:
+                break
+            line.append(result[1])
+            position.make_move(result[1])
+        for _ in line:
+            position.unmake_move()
+        return line
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        for table_file in self.files:
+            table_file.close()
+
+
+_endgame_tables = {}
+
+def get_endgame_tables(path=ENDGAME_TABLE_PATH):
+    # Opened once per path; None when no tables have been generated
+    if path not in _endgame_tables:
+        tables = EndgameTables(path)
+        _endgame_tables[path] = tables if tables.tables else None
+    return _endgame_tables[path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the endgame tables by retrograde analysis")
+    parser.add_argument('signatures', nargs='*', help=f"tables to build: {', '.join(TABLE_SIGNATURES)} (default: all)")
+    parser.add_argument('-o', '--output', default=ENDGAME_TABLE_PATH, help="directory to write the tables to")
+    args = parser.parse_args()
+    for signature in args.signatures:
+        if signature not in TABLE_SIGNATURES:
+            parser.error(f"unknown table {signature}")
+
+    os.makedirs(args.output, exist_ok=True)
+    report = []
+    for signature in args.signatures or TABLE_SIGNATURES:
+        start = time.perf_counter()
+        values = generate_table(signature)
+        with open(os.path.join(args.output, signature + '.bin'), 'wb') as table_file:
+            table_file.write(values)
+        wins = [value - WIN for value in values if WIN <= value < LOSS]
+        report.append({'signature': signature, 'entries': len(values), 'wins': len(wins),
+                       'losses': sum(1 for value in values if value >= LOSS),
+                       'longest_mate': max(wins, default=0), 'time': round(time.perf_counter() - start, 3)})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,14 @@
-import copy
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from constants import *
-board_history = []
+from position import Position, NULL_MOVE, PIECE_CHARS, PIECE_SQUARE_VALUES, SIDE_COLORS, decode_move, move_name, square_of
+from bitboard import BitboardPosition
+from book import get_opening_book
+from endgame import get_endgame_tables, TABLE_PIECES
+from stats import SearchStats, format_info
+from transposition import TranspositionTable, DEFAULT_HASH_MB, EXACT, LOWER_BOUND, UPPER_BOUND
 
 def display_chessboard(chessboard):
     for row in chessboard:
@@ -128,7 +136,7 @@ def generate_king_moves(chessboard, row, col, piece, castling_rights, include_ca
 
     return possible_moves
 
-def get_legal_moves(chessboard, player_color, castling_rights):
+def get_pseudo_legal_moves(chessboard, player_color, castling_rights, include_castling=True):
     pseudolegal_moves = []
     
     for row in range(8):
@@ -150,20 +158,31 @@ def get_legal_moves(chessboard, player_color, castling_rights):
                 elif piece_type == 'q':
                     pseudolegal_moves += generate_queen_moves(chessboard, row, col, piece)
                 elif piece_type == 'k':
-                    pseudolegal_moves += generate_king_moves(chessboard, row, col, piece, castling_rights, include_castling=True)
-
-    legal_moves = []
-    for move in pseudolegal_moves:
-        new_board, new_castling = execute_move(chessboard, move, castling_rights)
-        king_pos = find_king_position(new_board, player_color)
-        if king_pos and not is_king_under_attack(new_board, king_pos, player_color, new_castling):
-            legal_moves.append(move)
-    
-    return legal_moves
+                    pseudolegal_moves += generate_king_moves(chessboard, row, col, piece, castling_rights, include_castling=include_castling)
+
+    return pseudolegal_moves
+
+# Both backends make the same moves in the same positions; the bitboard one keeps piece sets
+# as ints next to the board list and generates moves with set operations
+POSITION_BACKENDS = {'mailbox': Position, 'bitboard': BitboardPosition}
+_position_class = POSITION_BACKENDS[POSITION_BACKEND]
+
+def set_position_backend(name):
+    global _position_class
+    if name not in POSITION_BACKENDS:
+        raise ValueError(f"Unknown position backend: {name}")
+    _position_class = POSITION_BACKENDS[name]
+
+def get_position_class():
+    return _position_class
+
+def get_legal_moves(chessboard, player_color, castling_rights):
+    position = _position_class.from_board(chessboard, player_color, castling_rights)
+    return [decode_move(move) for move in position.legal_moves()]
 
 def execute_move(chessboard, move, castling_rights):
-    new_castling = copy.deepcopy(castling_rights)
-    new_board = copy.deepcopy(chessboard)
+    new_castling = {color: dict(sides) for color, sides in castling_rights.items()}
+    new_board = [row[:] for row in chessboard]
     (start_row, start_col), (end_row, end_col) = move
     piece = new_board[start_row][start_col]
 
@@ -196,79 +215,756 @@ def execute_move(chessboard, move, castling_rights):
 
     return new_board, new_castling
 
-def minimax(chessboard, depth, is_maximizing, alpha, beta, castling_rights):
-    if depth == 0:
-        return calculate_board_score(chessboard), None
+def evaluate_position(position):
+    # Kept up to date by make_move/unmake_move, equal to calculate_board_score of the board
+    return position.score
 
-    current_player = 'w' if is_maximizing else 'b'
-    legal_moves = get_legal_moves(chessboard, current_player, castling_rights)
-    
-    if not legal_moves:
-        king_position = find_king_position(chessboard, current_player)
-        if king_position and is_king_under_attack(chessboard, king_position, current_player, castling_rights):
-            return (-float('inf') if is_maximizing else float('inf')), None
+# Absolute material value for each piece code, laid out like the board's piece tables
+ORDERING_VALUES = [abs(PIECE_VALUES.get(char, 0)) for char in PIECE_CHARS]
+FIRST_MOVE_SCORE = 1 << 40
+CAPTURE_SCORE = 1 << 32
+KILLER_SCORE = 1 << 31
+HISTORY_LIMIT = 1 << 30
+# Evaluation scores are multiples of 0.5, so nothing scores strictly between alpha - 0.25 and alpha
+ROOT_TIE_MARGIN = 0.25
+# A capture is skipped in quiescence when even its static gain plus this margin cannot reach alpha
+DELTA_MARGIN = 1
+# Quiescence stops this many plies past the main search's leaf, in check or not, and scores the
+# position statically; evasions of repeated checks would otherwise recurse without bound
+QUIESCENCE_MAX_PLIES = 16
+# Zero-window searches only ask whether a move beats a bound, which 0.25 above it settles
+SCOUT_WINDOW = 0.25
+# Null move: the side to move passes and is searched this much shallower
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_DEEP_REDUCTION = 3
+NULL_MOVE_DEEP_DEPTH = 7
+# Late move reductions: quiet moves from this index on are first searched one ply shallower,
+# and two plies shallower further down the list in deeper searches
+LMR_MIN_DEPTH = 3
+LMR_MIN_INDEX = 3
+LMR_DEEP_DEPTH = 5
+LMR_DEEP_INDEX = 8
+# Root aspiration window around the previous iteration's score
+ASPIRATION_WINDOW = 1
+
+class SearchTimeout(Exception):
+    pass
+
+class Searcher:
+    # A table entry from a deeper search also ends a shallower one. ParallelSearcher turns this
+    # off, as then a score would depend on which process happened to search a position first
+    exact_depth_cutoffs = False
+
+    def __init__(self, hash_mb=DEFAULT_HASH_MB, move_ordering=True, endgame_tables=True, quiescence=True,
+                 null_move=True, late_move_reductions=True, pvs=True, aspiration=True, staged_moves=True):
+        self.table = TranspositionTable(hash_mb)
+        self.move_ordering = move_ordering
+        self.staged_moves = staged_moves
+        self.quiescence = quiescence
+        self.null_move = null_move
+        self.late_move_reductions = late_move_reductions
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.endgame = get_endgame_tables() if endgame_tables else None
+        self.nodes = 0
+        self.next_check = float('inf')
+        # Off during an iterative search's first iteration, when only a stop request ends it
+        self.limits_active = True
+        self.deadline = None
+        self.node_limit = None
+        self.pv_moves = {}
+        self.pv = []
+        self.completed_depth = 0
+        self.stopped = False
+        # Keys of the game's earlier positions, and of those plus the current search path; a
+        # position met again is scored as a draw
+        self.game_history = ()
+        self.repetitions = set()
+        # The moves the root may choose from, as UCI searchmoves gives them; None for every move
+        self.root_moves = None
+        # Set on helper processes of a ParallelSearcher so the main process can stop them
+        self.shared_stop = None
+        # Also set on those helpers: one node count for all of them, checked against shared_node_limit
+        self.shared_nodes = None
+        self.shared_node_limit = None
+        self.reported_nodes = 0
+        self.killers = [[0, 0] for _ in range(MAX_SEARCH_DEPTH + 1)]
+        # Butterfly history: one from/to table per side, indexed by the low 12 bits of a move
+        self.history = {1: [0] * 4096, -1: [0] * 4096}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.null_cutoffs = 0
+        self.reductions = 0
+        self.researches = 0
+        # Move lists generated and moves legality checked, to show what staged generation saves
+        self.generations = 0
+        self.legality_checks = 0
+        self.quiet_stages_skipped = 0
+        # Instrumentation, off unless a search is started with a SearchStats or an info callback
+        self.stats = None
+        self.info = None
+        self.started = 0.0
+
+    def order_moves(self, position, moves, first_move, ply):
+        # Hash/PV move, then captures by MVV-LVA, then the two killers, then quiet moves by history
+        board = position.board
+        killer, second_killer = self.killers[ply]
+        history = self.history[position.side]
+
+        def move_score(move):
+            if move == first_move:
+                return FIRST_MOVE_SCORE
+            victim = board[move >> 6 & 63]
+            if victim:
+                return CAPTURE_SCORE + ORDERING_VALUES[victim] * 256 - ORDERING_VALUES[board[move & 63]]
+            if move == killer:
+                return KILLER_SCORE + 1
+            if move == second_killer:
+                return KILLER_SCORE
+            return history[move & 4095]
+
+        moves.sort(key=move_score, reverse=True)
+
+    def staged_move_picker(self, position, first_move, ply):
+        # Yields moves in order_moves' order, generating each stage only when the one before runs
+        # out: the hash move, captures by MVV-LVA, killers, then quiet moves by history. A cutoff
+        # in the early stages saves generating and legality checking the quiet moves at all.
+        # Quiet moves are sorted by the history as it stands when they are reached.
+        board = position.board
+        if first_move:
+            self.legality_checks += 1
+            if position.is_legal(first_move):
+                yield first_move
+            else:
+                first_move = 0
+        self.generations += 1
+        captures = position.legal_captures()
+        self.legality_checks += len(captures)
+        if len(captures) > 1:
+            captures.sort(key=lambda move: ORDERING_VALUES[board[move >> 6 & 63]] * 256 - ORDERING_VALUES[board[move & 63]],
+                          reverse=True)
+        for move in captures:
+            if move != first_move:
+                yield move
+        tried = [first_move]
+        for killer in self.killers[ply]:
+            # A killer that captures here was already tried with the captures
+            if killer and killer not in tried and not board[killer >> 6 & 63]:
+                self.legality_checks += 1
+                if position.is_legal(killer):
+                    tried.append(killer)
+                    yield killer
+        self.quiet_stages_skipped -= 1
+        self.generations += 1
+        quiets = position.legal_quiets()
+        self.legality_checks += len(quiets)
+        history = self.history[position.side]
+        quiets.sort(key=lambda move: history[move & 4095], reverse=True)
+        for move in quiets:
+            if move not in tried:
+                yield move
+
+    def record_cutoff(self, position, move, depth, ply):
+        if position.board[move >> 6 & 63]:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self.history[position.side]
+        history[move & 4095] += depth * depth
+        if history[move & 4095] > HISTORY_LIMIT:
+            for side_history in self.history.values():
+                for index in range(4096):
+                    side_history[index] //= 2
+
+    def new_search(self):
+        self.table.new_search()
+        self.killers = [[0, 0] for _ in range(MAX_SEARCH_DEPTH + 1)]
+        for side_history in self.history.values():
+            for index in range(4096):
+                side_history[index] //= 8
+        self.cutoffs = self.first_move_cutoffs = 0
+        self.null_cutoffs = self.reductions = self.researches = 0
+        self.generations = self.legality_checks = self.quiet_stages_skipped = 0
+
+    def check_limits(self):
+        if self.stopped or (self.shared_stop is not None and self.shared_stop.value):
+            raise SearchTimeout()
+        if self.limits_active:
+            if self.node_limit is not None and self.nodes >= self.node_limit:
+                raise SearchTimeout()
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.shared_node_limit is not None and self.report_nodes() >= self.shared_node_limit:
+                raise SearchTimeout()
+        self.next_check = self.nodes + LIMIT_CHECK_INTERVAL
+        if self.node_limit is not None:
+            self.next_check = min(self.next_check, self.node_limit)
+
+    def report_nodes(self):
+        # Adds the nodes searched since the last report to the shared count and returns the new total
+        with self.shared_nodes.get_lock():
+            self.shared_nodes.value += self.nodes - self.reported_nodes
+            total = self.shared_nodes.value
+        self.reported_nodes = self.nodes
+        return total
+
+    def search(self, position, depth, alpha, beta, ply=0):
+        # Negamax over the make/unmake position; scores are from the side to move's view
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_limits()
+        stats = self.stats
+        if stats is not None:
+            stats.ply_nodes[ply] += 1
+            if depth == 0:
+                stats.leaf_nodes += 1
+
+        key = position.key
+        if ply > 0 and key in self.repetitions:
+            return 0, None
+
+        if self.endgame is not None and ply > 0 and position.pieces <= TABLE_PIECES:
+            score = self.endgame.probe(position)
+            if score is not None:
+                return score, None
+
+        if depth == 0:
+            if self.quiescence:
+                return self.quiesce(position, alpha, beta, ply), None
+            return position.side * evaluate_position(position), None
+
+        table = self.table
+        entry = table.probe(key)
+        hash_move = 0
+        if entry is not None:
+            entry_depth, entry_score, bound, hash_move = entry
+            if ply > 0 and (entry_depth == depth or entry_depth > depth and not self.exact_depth_cutoffs):
+                if bound == EXACT:
+                    return entry_score, hash_move or None
+                if bound == LOWER_BOUND and entry_score >= beta:
+                    return entry_score, hash_move or None
+                if bound == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score, hash_move or None
+
+        in_check = None
+        if (self.null_move and ply > 0 and depth >= NULL_MOVE_MIN_DEPTH
+                and position.side * evaluate_position(position) >= beta and position.stack[-1][0] != NULL_MOVE):
+            # If passing still holds beta the node is not worth a full search. Never two passes in a
+            # row, and never in check or with only pawns left, where passing can be the better move
+            in_check = position.in_check()
+            if not in_check and position.has_pieces(position.side):
+                reduction = NULL_MOVE_DEEP_REDUCTION if depth >= NULL_MOVE_DEEP_DEPTH else NULL_MOVE_REDUCTION
+                position.make_null_move()
+                score = -self.search(position, max(0, depth - 1 - reduction), -beta, -beta + SCOUT_WINDOW, ply + 1)[0]
+                position.unmake_null_move()
+                if score >= beta:
+                    self.null_cutoffs += 1
+                    # A mate found after passing is not a mate the side to move can count on
+                    return (score if score != float('inf') else beta), None
+
+        first_move = self.pv_moves.get(key, hash_move)
+        root_order = None
+        if self.staged_moves and self.move_ordering and ply > 0:
+            # Counted as skipped up front; the picker takes it back if it reaches the quiet moves
+            self.quiet_stages_skipped += 1
+            legal_moves = self.staged_move_picker(position, first_move, ply)
         else:
-            return 0, None 
+            legal_moves = position.legal_moves()
+            if ply == 0 and self.root_moves:
+                legal_moves = [move for move in legal_moves if move in self.root_moves]
+            self.generations += 1
+            self.legality_checks += len(legal_moves)
+            if not legal_moves:
+                if position.in_check():
+                    return -float('inf'), None
+                else:
+                    return 0, None
+            # The root keeps generation order for breaking ties between equal moves
+            root_order = {move: index for index, move in enumerate(legal_moves)} if ply == 0 else None
+            if self.move_ordering:
+                self.order_moves(position, legal_moves, first_move, ply)
+            elif first_move and first_move in legal_moves:
+                legal_moves.remove(first_move)
+                legal_moves.insert(0, first_move)
 
-    best_move = None
-    
-    if is_maximizing:
+        reduce = self.late_move_reductions and ply > 0 and depth >= LMR_MIN_DEPTH
+        if reduce:
+            if in_check is None:
+                in_check = position.in_check()
+            reduce = not in_check
+        board = position.board
+        original_alpha = alpha
+        best_move = None
         max_score = -float('inf')
-        for move in legal_moves:
-            new_board, new_castling = execute_move(chessboard, move, castling_rights)
-            current_score, _ = minimax(new_board, depth - 1, False, alpha, beta, new_castling)
-            if current_score > max_score:
+        self.repetitions.add(key)
+        index = -1
+        for index, move in enumerate(legal_moves):
+            # Root moves are searched just below alpha so that moves tying the best get exact
+            # scores; ties then go to generation order, whatever order the moves were tried in
+            lower = alpha if root_order is None else alpha - ROOT_TIE_MARGIN
+            reduction = 0
+            if reduce and index >= LMR_MIN_INDEX and not board[move >> 6 & 63]:
+                reduction = 2 if index >= LMR_DEEP_INDEX and depth >= LMR_DEEP_DEPTH else 1
+            position.make_move(move)
+            current_score = None
+            scout = self.pvs and index > 0 and lower != -float('inf')
+            if reduction and not position.in_check():
+                self.reductions += 1
+                current_score = -self.search(position, depth - 1 - reduction, -(lower + SCOUT_WINDOW) if scout else -beta,
+                                             -lower, ply + 1)[0]
+                if current_score > lower:
+                    self.researches += 1
+                    current_score = None
+            if current_score is None and scout:
+                # Later moves only have to be shown no better than alpha, which a zero window
+                # does cheaply; one that beats it is searched again with the full window
+                current_score = -self.search(position, depth - 1, -(lower + SCOUT_WINDOW), -lower, ply + 1)[0]
+                if lower < current_score < beta:
+                    self.researches += 1
+                    current_score = None
+            if current_score is None:
+                current_score = -self.search(position, depth - 1, -beta, -lower, ply + 1)[0]
+            position.unmake_move()
+            if current_score > max_score or (root_order is not None and best_move is not None
+                                             and current_score == max_score and root_order[move] < root_order[best_move]):
                 max_score = current_score
                 best_move = move
             alpha = max(alpha, current_score)
             if beta <= alpha:
+                self.cutoffs += 1
+                if index == 0:
+                    self.first_move_cutoffs += 1
+                if self.move_ordering:
+                    self.record_cutoff(position, move, depth, ply)
                 break
+        self.repetitions.discard(key)
+        if index < 0:
+            # Only the staged picker gets here without moves, once it has generated every stage
+            return (-float('inf') if position.in_check() else 0), None
+
+        if max_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif max_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        table.store(key, depth, max_score, bound, best_move or 0)
         return max_score, best_move
-    else:
-        min_score = float('inf')
-        for move in legal_moves:
-            new_board, new_castling = execute_move(chessboard, move, castling_rights)
-            current_score, _ = minimax(new_board, depth - 1, True, alpha, beta, new_castling)
-            if current_score < min_score:
-                min_score = current_score
-                best_move = move
-            beta = min(beta, current_score)
-            if beta <= alpha:
+
+    def quiesce(self, position, alpha, beta, ply, quiescence_ply=0):
+        # Captures only, so leaves are scored once the exchanges on the board have settled
+        if quiescence_ply >= QUIESCENCE_MAX_PLIES:
+            return position.side * evaluate_position(position)
+        if position.in_check():
+            # No standing pat while in check: every evasion is tried, and none means mate
+            moves = position.legal_moves()
+            if not moves:
+                return -float('inf')
+            best_score = -float('inf')
+        else:
+            best_score = position.side * evaluate_position(position)
+            if best_score >= beta:
+                return best_score
+            alpha = max(alpha, best_score)
+            moves = position.legal_captures()
+        board = position.board
+        side = position.side
+        stand_pat = best_score
+        if len(moves) > 1:
+            moves.sort(key=lambda move: ORDERING_VALUES[board[move >> 6 & 63]] * 256 - ORDERING_VALUES[board[move & 63]],
+                       reverse=True)
+        for move in moves:
+            start, end = move & 63, move >> 6 & 63
+            victim = board[end]
+            if stand_pat != -float('inf') and victim:
+                piece = board[start]
+                gain = side * (PIECE_SQUARE_VALUES[piece][end] - PIECE_SQUARE_VALUES[piece][start]
+                               - PIECE_SQUARE_VALUES[victim][end])
+                # Delta pruning, then captures that lose material once the exchange plays out
+                if stand_pat + gain + DELTA_MARGIN <= alpha or position.see(move) < 0:
+                    continue
+            self.nodes += 1
+            if self.nodes >= self.next_check:
+                self.check_limits()
+            position.make_move(move)
+            score = -self.quiesce(position, -beta, -alpha, ply + 1, quiescence_ply + 1)
+            position.unmake_move()
+            if score > best_score:
+                best_score = score
+                if score >= beta:
+                    return score
+                alpha = max(alpha, score)
+        return best_score
+
+    def principal_variation(self, position, depth):
+        pv = []
+        seen = set()
+        while len(pv) < depth and position.key not in seen:
+            seen.add(position.key)
+            entry = self.table.probe(position.key)
+            if entry is None or not entry[3] or entry[3] not in position.legal_moves():
                 break
-        return min_score, best_move
+            pv.append(entry[3])
+            position.make_move(entry[3])
+        for _ in pv:
+            position.unmake_move()
+        return pv
+
+    def begin_search(self, depth=None, max_time_ms=None, max_nodes=None, stats=None, info=None, history=(),
+                     root_moves=None):
+        if depth is None:
+            limited = max_time_ms is not None or max_nodes is not None
+            depth = MAX_SEARCH_DEPTH if limited else DEFAULT_SEARCH_DEPTH
+        self.new_search()
+        self.set_limits(max_time_ms, max_nodes)
+        self.stats = stats
+        self.info = info
+        self.game_history = tuple(history)
+        self.root_moves = set(root_moves) if root_moves else None
+        # The first iteration always completes so there is a move to return, unless stopped; a
+        # stop flag set by another process is only seen by polling, so then the checks go on
+        self.limits_active = False
+        self.next_check = float('inf') if self.shared_stop is None else 0
+        self.pv_moves = {}
+        self.pv = []
+        self.completed_depth = 0
+        return depth
+
+    def set_limits(self, max_time_ms=None, max_nodes=None):
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = time.perf_counter() + max_time_ms / 1000 if max_time_ms is not None else None
+        self.node_limit = max_nodes
+        self.reported_nodes = 0
+        self.limits_active = True
+        self.next_check = 0
+        self.started = time.perf_counter()
+
+    def iteration_info(self, depth, score):
+        elapsed = time.perf_counter() - self.started
+        return {'depth': depth, 'score': score, 'nodes': self.nodes, 'nps': int(self.nodes / elapsed) if elapsed else 0,
+                'time_ms': int(elapsed * 1000), 'hashfull': self.table.hashfull(), 'pv': list(self.pv)}
+
+    def search_root(self, position, depth, previous_score):
+        # Aspiration: the root starts with a window around the previous iteration's score, and
+        # only the side that fails is opened up for the re-search
+        if not self.aspiration or depth == 1 or abs(previous_score) == float('inf'):
+            return self.search(position, depth, -float('inf'), float('inf'))
+        alpha, beta = previous_score - ASPIRATION_WINDOW, previous_score + ASPIRATION_WINDOW
+        while True:
+            score, move = self.search(position, depth, alpha, beta)
+            # The root searches just below alpha, so a score equal to alpha is still exact
+            if score < alpha:
+                alpha = -float('inf')
+            elif score >= beta and beta != float('inf'):
+                beta = float('inf')
+            else:
+                return score, move
+            self.researches += 1
+
+    def iterate(self, position, depth):
+        # Iterative deepening: each iteration starts from the previous principal variation,
+        # and once the budget runs out the last completed iteration's move is returned
+        if self.endgame is not None and position.pieces <= TABLE_PIECES and not self.root_moves:
+            exact = self.endgame.best_move(position)
+            if exact is not None:
+                # The tables already know the result, so there is nothing to iterate
+                self.completed_depth = depth
+                self.pv = self.endgame.best_line(position, depth)
+                if self.info is not None:
+                    self.info(self.iteration_info(depth, exact[0]))
+                self.next_check = float('inf')
+                self.deadline = self.node_limit = None
+                return exact
+        root_stack = len(position.stack)
+        best_score, best_move = 0, None
+        for current_depth in range(1, depth + 1):
+            if self.stats is not None:
+                self.stats.start_iteration(self)
+            # A search that timed out may have left its path behind
+            self.repetitions = set(self.game_history)
+            try:
+                score, move = self.search_root(position, current_depth, best_score)
+            except SearchTimeout:
+                position.unwind(root_stack)
+                break
+            best_score, best_move = score, move
+            self.completed_depth = current_depth
+            if move is None:
+                break
+            if self.stats is not None:
+                self.stats.end_iteration(self, current_depth, score, move)
+            self.pv = self.principal_variation(position, current_depth)
+            if self.info is not None:
+                self.info(self.iteration_info(current_depth, score))
+            if abs(score) == float('inf'):
+                break
+            pv_keys = []
+            for pv_move in self.pv:
+                pv_keys.append((position.key, pv_move))
+                position.make_move(pv_move)
+            for _ in pv_keys:
+                position.unmake_move()
+            self.pv_moves = dict(pv_keys)
+            self.limits_active = True
+            if self.deadline is not None or self.node_limit is not None or self.shared_stop is not None:
+                self.next_check = 0
+        self.next_check = float('inf')
+        self.deadline = self.node_limit = None
+        self.pv_moves = {}
+        self.repetitions = set()
+        self.root_moves = None
+        return best_score, best_move
+
+    def find_best_move(self, position, depth=None, max_time_ms=None, max_nodes=None, stats=None, info=None, history=(),
+                       root_moves=None):
+        # history: keys of the positions played before this one, as GameState.search_history gives
+        return self.iterate(position, self.begin_search(depth, max_time_ms, max_nodes, stats, info, history,
+                                                        root_moves))
+
+    def stop(self):
+        # Safe to call from another thread: the search notices at its next node
+        self.stopped = True
+        self.next_check = 0
+
+    def ponderhit(self, max_time_ms=None, max_nodes=None):
+        # Turns a running open-ended search into a budgeted one
+        if max_time_ms is not None:
+            self.deadline = time.perf_counter() + max_time_ms / 1000
+        if max_nodes is not None:
+            self.node_limit = self.nodes + max_nodes
+        self.limits_active = True
+        self.next_check = 0
+
+class BackgroundSearch:
+    def __init__(self, searcher, position, depth=None, max_time_ms=None, max_nodes=None, stats=None, info=None,
+                 history=(), root_moves=None):
+        self.searcher = searcher
+        self.position = position
+        self.result = None
+        depth = searcher.begin_search(depth, max_time_ms, max_nodes, stats, info, history, root_moves)
+        self.thread = threading.Thread(target=self.run, args=(depth,), daemon=True)
+        self.thread.start()
 
-def find_best_move(chessboard, depth=3, is_maximizing=True, castling_rights=None):
+    def run(self, depth):
+        self.result = self.searcher.iterate(self.position, depth)
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def stop(self):
+        while self.thread.is_alive():
+            self.searcher.stop()
+            self.thread.join(0.01)
+        return self.result
+
+_worker_searcher = None
+_worker_alpha = None
+_worker_search_id = None
+
+def _init_parallel_worker(shared_alpha, shared_stop, shared_nodes, hash_mb, options):
+    global _worker_searcher, _worker_alpha
+    _worker_searcher = Searcher(hash_mb, **options)
+    _worker_searcher.exact_depth_cutoffs = True
+    _worker_searcher.shared_stop = shared_stop
+    _worker_searcher.shared_nodes = shared_nodes
+    _worker_alpha = shared_alpha
+
+def _search_root_move(search_id, position_class, board, side, castling, move, depth, pv_moves, history, max_time_ms, max_nodes):
+    # Runs in a pool process: searches one root move against the alpha shared by all workers
+    global _worker_search_id
+    searcher = _worker_searcher
+    if search_id != _worker_search_id:
+        searcher.new_search()
+        _worker_search_id = search_id
+    # max_nodes is the budget of the whole search, so it is checked against the shared count
+    searcher.set_limits(max_time_ms)
+    searcher.shared_node_limit = max_nodes
+    searcher.pv_moves = pv_moves
+    position = position_class(board, side, castling)
+    searcher.repetitions = set(history)
+    searcher.repetitions.add(position.key)
+    position.make_move(move)
+    alpha = _worker_alpha.value - ROOT_TIE_MARGIN
+    try:
+        score = -searcher.search(position, depth - 1, -float('inf'), -alpha, 1)[0]
+    except SearchTimeout:
+        return None, searcher.nodes, []
+    finally:
+        searcher.pv_moves = {}
+        if max_nodes is not None:
+            searcher.report_nodes()
+    with _worker_alpha.get_lock():
+        if score > _worker_alpha.value:
+            _worker_alpha.value = score
+    return score, searcher.nodes, searcher.principal_variation(position, depth - 1)
+
+class ParallelSearcher(Searcher):
+    # Root splitting over a process pool that is kept for the searcher's lifetime. The first
+    # root move is searched on its own to set alpha, then the rest go out in parallel and pick
+    # up each other's improvements to alpha when they start.
+    # Results equal a serial search with the same options only when null_move and
+    # late_move_reductions are off: both change a node's score with its window, and the
+    # workers search with other windows than a serial search would.
+    exact_depth_cutoffs = True
+
+    def __init__(self, workers, hash_mb=DEFAULT_HASH_MB, **options):
+        super().__init__(hash_mb, **options)
+        self.workers = workers
+        self.shared_alpha = multiprocessing.Value('d', -float('inf'))
+        self.shared_stop = multiprocessing.Value('b', 0)
+        # Nodes searched so far in this search, by this process and every worker
+        self.shared_nodes = multiprocessing.Value('q', 0)
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_parallel_worker,
+                                        initargs=(self.shared_alpha, self.shared_stop, self.shared_nodes,
+                                                  hash_mb, options))
+        # The split root always returns exact scores, so there is no window to aspire to
+        self.aspiration = False
+        self.search_id = 0
+        self.root_pv = (None, [])
+
+    def new_search(self):
+        super().new_search()
+        self.search_id += 1
+
+    def check_limits(self):
+        # The main process only waits on the pool, so shared_stop is not its own stop signal
+        if self.stopped:
+            raise SearchTimeout()
+        if not self.limits_active:
+            self.next_check = self.nodes + LIMIT_CHECK_INTERVAL
+            return
+        if self.node_limit is not None and max(self.nodes, self.shared_nodes.value) >= self.node_limit:
+            raise SearchTimeout()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def search(self, position, depth, alpha, beta, ply=0):
+        if ply > 0 or depth < 2:
+            return super().search(position, depth, alpha, beta, ply)
+        self.nodes += 1
+        legal_moves = position.legal_moves()
+        if self.root_moves:
+            legal_moves = [move for move in legal_moves if move in self.root_moves]
+        if not legal_moves:
+            return (-float('inf') if position.in_check() else 0), None
+
+        key = position.key
+        root_order = {move: index for index, move in enumerate(legal_moves)}
+        entry = self.table.probe(key)
+        first_move = self.pv_moves.get(key, entry[3] if entry is not None else 0)
+        if self.move_ordering:
+            self.order_moves(position, legal_moves, first_move, ply)
+        elif first_move and first_move in legal_moves:
+            legal_moves.remove(first_move)
+            legal_moves.insert(0, first_move)
+
+        self.shared_alpha.value = -float('inf')
+        self.shared_nodes.value = self.nodes
+        results = {legal_moves[0]: self.submit(position, legal_moves[0], depth).result()}
+        pending = {self.submit(position, move, depth): move for move in legal_moves[1:]}
+        timed_out = results[legal_moves[0]][0] is None
+        while pending and not timed_out:
+            done, _ = wait(pending, timeout=0.01, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+            try:
+                self.check_limits()
+            except SearchTimeout:
+                timed_out = True
+        if timed_out or any(result[0] is None for result in results.values()):
+            self.shared_stop.value = 1
+            for future in pending:
+                future.result()
+            self.shared_stop.value = 0
+            raise SearchTimeout()
+
+        best_move = None
+        max_score = -float('inf')
+        for move in legal_moves:
+            score, nodes, child_pv = results[move]
+            self.nodes += nodes
+            if score > max_score or (best_move is not None and score == max_score
+                                     and root_order[move] < root_order[best_move]):
+                max_score, best_move = score, move
+        self.table.store(key, depth, max_score, EXACT, best_move)
+        self.root_pv = (key, [best_move] + results[best_move][2])
+        return max_score, best_move
+
+    def submit(self, position, move, depth):
+        max_time_ms = None
+        if self.deadline is not None:
+            max_time_ms = max(0.0, (self.deadline - time.perf_counter()) * 1000)
+        return self.pool.submit(_search_root_move, self.search_id, type(position), position.board[:], position.side,
+                                position.castling, move, depth, self.pv_moves, self.game_history, max_time_ms, self.node_limit)
+
+    def principal_variation(self, position, depth):
+        key, pv = self.root_pv
+        if key == position.key and pv:
+            return pv[:depth]
+        return super().principal_variation(position, depth)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+_parallel_searchers = {}
+
+def get_parallel_searcher(workers, hash_mb=DEFAULT_HASH_MB, **options):
+    # Pools are expensive to start, so one searcher per worker count and options is kept and reused
+    key = (workers, hash_mb, tuple(sorted(options.items())))
+    if key not in _parallel_searchers:
+        _parallel_searchers[key] = ParallelSearcher(workers, hash_mb, **options)
+    return _parallel_searchers[key]
+
+_default_searchers = {}
+
+def get_default_searcher(**options):
+    # Created on first use so that importing the engine stays cheap; one per set of options
+    key = tuple(sorted(options.items()))
+    if key not in _default_searchers:
+        _default_searchers[key] = Searcher(**options)
+    return _default_searchers[key]
+
+def probe_book(position, path=OPENING_BOOK_PATH, policy=BOOK_POLICY):
+    book = get_opening_book(path)
+    return book.choose(position, policy) if book is not None else None
+
+def minimax(chessboard, depth, is_maximizing, alpha, beta, castling_rights, searcher=None, **options):
+    # options switch Searcher features such as null_move, late_move_reductions, pvs or aspiration
+    if searcher is None:
+        searcher = get_default_searcher(**options)
+    position = _position_class.from_board(chessboard, 'w' if is_maximizing else 'b', castling_rights)
+    if is_maximizing:
+        score, best_move = searcher.search(position, depth, alpha, beta)
+    else:
+        score, best_move = searcher.search(position, depth, -beta, -alpha)
+        score = -score
+    return score, decode_move(best_move) if best_move is not None else None
+
+def find_best_move(chessboard, depth=None, is_maximizing=True, castling_rights=None, searcher=None,
+                   max_time_ms=None, max_nodes=None, workers=None, use_book=True, stats=None, info=None, **options):
     if castling_rights is None:
         castling_rights = reset_castling_rights()
-    _, best_move = minimax(chessboard, depth, is_maximizing, -float('inf'), float('inf'), castling_rights)
-    return best_move
+    position = _position_class.from_board(chessboard, 'w' if is_maximizing else 'b', castling_rights)
+    book_move = probe_book(position) if use_book else None
+    if book_move is not None:
+        return decode_move(book_move)
+    if searcher is None:
+        # With workers the move can differ from the serial search's unless null_move and
+        # late_move_reductions are turned off here; see ParallelSearcher
+        searcher = get_parallel_searcher(workers, **options) if workers else get_default_searcher(**options)
+    _, best_move = searcher.find_best_move(position, depth, max_time_ms, max_nodes, stats, info)
+    return decode_move(best_move) if best_move is not None else None
+
 def is_king_under_attack(chessboard, king_position, player_color, castling_rights):
-    opponent_color = 'b' if player_color == 'w' else 'w'
-    opponent_moves = []
-    
-    for row in range(8):
-        for col in range(8):
-            piece = chessboard[row][col]
-            if piece == "-":
-                continue
-                
-            if (piece.isupper() and opponent_color == 'w') or (piece.islower() and opponent_color == 'b'):
-                piece_type = piece.lower()
-                if piece_type == 'p':
-                    opponent_moves += generate_pawn_moves(chessboard, row, col, piece, opponent_color)
-                elif piece_type == 'n':
-                    opponent_moves += generate_knight_moves(chessboard, row, col, piece)
-                elif piece_type == 'b':
-                    opponent_moves += generate_bishop_moves(chessboard, row, col, piece)
-                elif piece_type == 'r':
-                    opponent_moves += generate_rook_moves(chessboard, row, col, piece)
-                elif piece_type == 'q':
-                    opponent_moves += generate_queen_moves(chessboard, row, col, piece)
-                elif piece_type == 'k':
-                    # Disable castling checks when verifying king safety
-                    opponent_moves += generate_king_moves(chessboard, row, col, piece, castling_rights, include_castling=False)
-    
-    return any(move[1] == king_position for move in opponent_moves)
+    if king_position is None:
+        return False
+    position = _position_class.from_board(chessboard, player_color, castling_rights)
+    row, col = king_position
+    return position.is_attacked(square_of(row, col), -position.side)
 
 def find_king_position(chessboard, player_color):
     king_symbol = 'K' if player_color == 'w' else 'k'
@@ -283,35 +979,21 @@ def check_king_status(chessboard):
     black_king_exists = any('k' in row for row in chessboard)
     return white_king_exists, black_king_exists
 
-def save_board_state(chessboard):
-    board_history.append(copy.deepcopy(chessboard))
-
 def validate_castling(board, player_color, side, castling_rights):
-    row = 7 if player_color == 'w' else 0
-    king_col = 4
-    rook_col = 7 if side == 'kingside' else 0
-    step = 1 if side == 'kingside' else -1
+    position = _position_class.from_board(board, player_color, castling_rights)
+    return position.can_castle(position.side, side == 'kingside')
 
-    if not castling_rights[player_color][side]:
-        return False
-    if board[row][king_col].lower() != 'k' or board[row][rook_col].lower() != 'r':
-        return False
-    for col in range(min(king_col, rook_col) + 1, max(king_col, rook_col)):
-        if board[row][col] != '-':
-            return False
-    king_pos = (row, king_col)
-    if is_king_under_attack(board, king_pos, player_color, castling_rights):
-        return False
+def reset_castling_rights():
+    # A fresh dict each time, so callers never share (and mutate) the same rights
+    return {'w': {'kingside': True, 'queenside': True}, 'b': {'kingside': True, 'queenside': True}}
 
-    current_castling = copy.deepcopy(castling_rights)
-    for i in (1, 2):
-        new_col = king_col + step * i
-        temp_board, new_castling = execute_move(board, ((row, king_col), (row, new_col)), current_castling)
-        if is_king_under_attack(temp_board, (row, new_col), player_color, new_castling):
-            return False
-        current_castling = new_castling 
+def parse_fen(fen):
+    position = _position_class.from_fen(fen)
+    return position.to_board(), SIDE_COLORS[position.side], position.castling_rights()
 
-    return True
-def reset_castling_rights():
-    castling_rights['w'] = {'kingside': True, 'queenside': True}
-    castling_rights['b'] = {'kingside': True, 'queenside': True}
\ No newline at end of file
+def board_to_fen(chessboard, player_color, castling_rights):
+    return _position_class.from_board(chessboard, player_color, castling_rights).fen()
+
+def format_score(score):
+    # JSON has no infinity, so mate scores are written as strings
+    return score if abs(score) != float('inf') else ('+inf' if score > 0 else '-inf')
\ No newline at end of file
@@ -0,0 +1,220 @@
+from array import array
+from position import Position, EMPTY, PAWN, KING, SIDE_COLORS, move_san, parse_square, square_name
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+# A draw can be claimed once a hundred plies pass without a capture or pawn move
+FIFTY_MOVE_PLIES = 100
+# Plies between the snapshots positions are rebuilt from
+CHECKPOINT_INTERVAL = 32
+# Each ply of the move log is the move's 12 bits in a 16-bit word; positions are rebuilt from
+# the checkpoints, so nothing else about the move needs keeping
+PGN_LINE_LENGTH = 79
+RESULTS = {'repetition': '1/2-1/2', 'fifty-move': '1/2-1/2', 'stalemate': '1/2-1/2', None: '*'}
+
+
+def _play(position, move, halfmove_clock, fullmove_number):
+    # Makes move and returns the en passant square and move counters that follow it
+    board = position.board
+    start, end = move & 63, move >> 6 & 63
+    pawn_move = board[start] * position.side == PAWN
+    halfmove_clock = 0 if pawn_move or board[end] != EMPTY else halfmove_clock + 1
+    en_passant = (start + end) // 2 if pawn_move and abs(end - start) == 16 else None
+    position.make_move(move)
+    if position.side == 1:
+        fullmove_number += 1
+    return en_passant, halfmove_clock, fullmove_number
+
+
+def _fen(position, en_passant, halfmove_clock, fullmove_number):
+    fields = position.fen().split()[:3]
+    fields.append(square_name(en_passant) if en_passant is not None else '-')
+    return ' '.join(fields + [str(halfmove_clock), str(fullmove_number)])
+
+
+class GameState:
+    # A game in progress: the position, plus what the board alone does not show. The game is
+    # kept as a log of encoded moves with a snapshot every CHECKPOINT_INTERVAL plies, so any
+    # earlier position is a short replay away. Position keys are kept in order, and the ones
+    # since the last capture or pawn move are counted, so repetition checks never rescan the game.
+    # The en passant square is tracked for FEN; these rules have no en passant capture, so it
+    # never makes two otherwise equal positions different.
+    def __init__(self, position, en_passant=None, halfmove_clock=0, fullmove_number=1):
+        self.position = position
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.moves = array('H')
+        self.keys = array('Q', [position.key])
+        self.counts = {position.key: 1}
+        self.checkpoints = [self.snapshot()]
+        # Moves taken back, the next one to redo last
+        self.redo_moves = array('H')
+
+    @classmethod
+    def from_fen(cls, fen=START_FEN, position_class=Position):
+        fields = fen.split()
+        position = position_class.from_fen(fen)
+        en_passant = None
+        if len(fields) > 3 and fields[3] != '-':
+            try:
+                en_passant = parse_square(fields[3])
+            except (ValueError, IndexError):
+                raise ValueError(f"Invalid FEN en passant square: {fields[3]}")
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN move counters: {' '.join(fields[4:6])}")
+        return cls(position, en_passant, halfmove_clock, fullmove_number)
+
+    @classmethod
+    def from_board(cls, chessboard, player_color='w', castling_rights=None, position_class=Position):
+        return cls(position_class.from_board(chessboard, player_color, castling_rights))
+
+    def fen(self):
+        return _fen(self.position, self.en_passant, self.halfmove_clock, self.fullmove_number)
+
+    @property
+    def side(self):
+        return self.position.side
+
+    @property
+    def player_color(self):
+        return SIDE_COLORS[self.position.side]
+
+    @property
+    def ply(self):
+        return len(self.moves)
+
+    def snapshot(self):
+        # Pieces are stored by their table index, which fits a byte
+        position = self.position
+        return (bytes(piece % 13 for piece in position.board), position.side, position.castling,
+                self.en_passant, self.halfmove_clock, self.fullmove_number)
+
+    def make_move(self, move):
+        position = self.position
+        self.en_passant, self.halfmove_clock, self.fullmove_number = \
+            _play(position, move, self.halfmove_clock, self.fullmove_number)
+        # The log is the undo record, so the position's own stack is not kept growing
+        position.stack.clear()
+        self.moves.append(move)
+        key = position.key
+        self.keys.append(key)
+        if not self.halfmove_clock:
+            # Nothing from before a capture or pawn move can come back
+            self.counts = {}
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if len(self.moves) % CHECKPOINT_INTERVAL == 0:
+            self.checkpoints.append(self.snapshot())
+        redo_moves = self.redo_moves
+        if redo_moves:
+            if redo_moves[-1] == move:
+                redo_moves.pop()
+            else:
+                del redo_moves[:]
+
+    def takeback(self, plies=1):
+        # Returns the number of plies actually taken back
+        plies = min(plies, len(self.moves))
+        if not plies:
+            return 0
+        ply = len(self.moves) - plies
+        for _ in range(plies):
+            self.redo_moves.append(self.moves.pop())
+        del self.keys[ply + 1:]
+        del self.checkpoints[ply // CHECKPOINT_INTERVAL + 1:]
+        self.position, self.en_passant, self.halfmove_clock, self.fullmove_number = self.replay(ply)
+        self.counts = {}
+        for key in self.keys[max(0, ply - self.halfmove_clock):]:
+            self.counts[key] = self.counts.get(key, 0) + 1
+        return plies
+
+    def redo(self, plies=1):
+        redone = 0
+        while redone < plies and self.redo_moves:
+            self.make_move(self.redo_moves[-1])
+            redone += 1
+        return redone
+
+    def replay(self, ply):
+        # (position, en_passant, halfmove_clock, fullmove_number) after the first ply moves,
+        # rebuilt from the nearest snapshot before it
+        board, side, castling, en_passant, halfmove_clock, fullmove_number = \
+            self.checkpoints[ply // CHECKPOINT_INTERVAL]
+        position = type(self.position)([index if index <= KING else index - 13 for index in board], side, castling)
+        for move in self.moves[ply // CHECKPOINT_INTERVAL * CHECKPOINT_INTERVAL:ply]:
+            en_passant, halfmove_clock, fullmove_number = _play(position, move, halfmove_clock, fullmove_number)
+        position.stack.clear()
+        return position, en_passant, halfmove_clock, fullmove_number
+
+    def position_at(self, ply):
+        return self.replay(ply)[0]
+
+    def repetitions(self):
+        # How many times the current position has occurred, this time included
+        return self.counts[self.keys[-1]]
+
+    def is_threefold_repetition(self):
+        return self.repetitions() >= 3
+
+    def is_fifty_move_draw(self):
+        return self.halfmove_clock >= FIFTY_MOVE_PLIES
+
+    def search_history(self):
+        # Keys of the earlier positions the current one can still repeat: none from before
+        # the last capture or pawn move can come back
+        return self.keys[max(0, len(self.keys) - 1 - self.halfmove_clock):-1].tolist()
+
+    def outcome(self):
+        # 'checkmate', 'stalemate', 'repetition', 'fifty-move' or None while the game goes on
+        position = self.position
+        if not position.legal_moves():
+            return 'checkmate' if position.in_check() else 'stalemate'
+        if self.is_threefold_repetition():
+            return 'repetition'
+        if self.is_fifty_move_draw():
+            return 'fifty-move'
+        return None
+
+    def result(self):
+        outcome = self.outcome()
+        if outcome == 'checkmate':
+            return '0-1' if self.position.side == 1 else '1-0'
+        return RESULTS[outcome]
+
+    def pgn(self, headers=None, result=None):
+        # The game so far as PGN, replayed from the first snapshot to write each move in SAN;
+        # result overrides the one the board shows, for games decided by adjudication
+        position, en_passant, halfmove_clock, fullmove_number = self.replay(0)
+        start_fen = _fen(position, en_passant, halfmove_clock, fullmove_number)
+        result = result or self.result()
+        tags = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?'}
+        tags.update(headers or {})
+        tags['Result'] = result
+        if start_fen != START_FEN:
+            tags['SetUp'] = '1'
+            tags['FEN'] = start_fen
+        tokens = []
+        for move in self.moves:
+            if position.side == 1:
+                tokens.append(f"{fullmove_number}.")
+            elif not tokens:
+                tokens.append(f"{fullmove_number}...")
+            tokens.append(move_san(position, move))
+            _, _, fullmove_number = _play(position, move, 0, fullmove_number)
+        tokens.append(result)
+        lines = []
+        for name, value in tags.items():
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'[{name} "{value}"]')
+        lines.append('')
+        line = ''
+        for token in tokens:
+            if line and len(line) + 1 + len(token) > PGN_LINE_LENGTH:
+                lines.append(line)
+                line = token
+            else:
+                line = f"{line} {token}" if line else token
+        lines.append(line)
+        return '\n'.join(lines) + '\n'
@@ -1,30 +1,58 @@
 import pygame
-import copy
-from pygame.locals import QUIT, MOUSEBUTTONDOWN
+import time
+from pygame.locals import QUIT, MOUSEBUTTONDOWN, KEYDOWN, K_ESCAPE, K_LEFT, K_RIGHT, K_s, VIDEOEXPOSE
 from engine import *
 from constants import *
+from game import GameState, START_FEN
+from position import decode_move, encode_move
+
+DRAW_MESSAGES = {'stalemate': "STALEMATE! GAME DRAWN", 'repetition': "DRAW BY REPETITION",
+                 'fifty-move': "DRAW BY FIFTY-MOVE RULE"}
 
 class ChessGame:
     def __init__(self):
         pygame.init()
-        self.board = copy.deepcopy(STARTING_BOARD)
-        self.current_player = 'w'
+        self.state = GameState.from_fen(START_FEN, get_position_class())
+        self.board = self.state.position.to_board()
+        self.current_player = self.state.player_color
         self.selected_piece = None
         self.valid_moves = []
         self.game_over = False
         self.game_result = None
         self.winner = None 
-        self.history = []
         self.square_size = 80
         self.width = self.height = 8 * self.square_size
         self.piece_images = self.load_images()
         self.message_font = pygame.font.Font(None, 60)
         self.subtext_font = pygame.font.Font(None, 36)
         self.move_indicator = self.create_move_indicator()
-        self.castling_rights = {
-            'w': {'kingside': True, 'queenside': True},
-            'b': {'kingside': True, 'queenside': True}
-        } 
+        self.searcher = Searcher()
+        self.ai_search = None
+        self.ponder_search = None
+        self.ponder_move = None
+        self.ponder_started = None
+        self.board_surface = self.create_board_surface()
+        # What each square showed when last drawn; only squares that differ are redrawn
+        self.drawn_squares = {}
+        self.overlay_drawn = False
+        self.view_changed = True
+        self.update_position_cache()
+
+    def update_position_cache(self):
+        # Everything the GUI asks about the current position, computed once per ply
+        position = self.state.position
+        self.legal_moves = [decode_move(move) for move in position.legal_moves()]
+        self.in_check = position.in_check()
+        self.view_changed = True
+
+    def create_board_surface(self):
+        colors = [(235, 235, 208), (119, 148, 85)]
+        surface = pygame.Surface((self.width, self.height))
+        for row in range(8):
+            for col in range(8):
+                pygame.draw.rect(surface, colors[(row + col) % 2],
+                                 (col * self.square_size, row * self.square_size, self.square_size, self.square_size))
+        return surface
 
     def create_move_indicator(self):
         indicator = pygame.Surface((self.square_size, self.square_size), pygame.SRCALPHA)
@@ -48,60 +76,47 @@ class ChessGame:
                 images[piece_code] = font.render(piece_code, True, color)
         return images
 
-    def draw_board(self, screen):
-        colors = [(235, 235, 208), (119, 148, 85)] 
-        for row in range(8):
-            for col in range(8):
-                rect = (
-                    col * self.square_size,
-                    row * self.square_size,
-                    self.square_size,
-                    self.square_size
-                )
-                color = colors[(row + col) % 2]
-                pygame.draw.rect(screen, color, rect)
-            
-                piece = self.board[row][col]
-                if piece != '-':
-                    screen.blit(self.piece_images[piece], rect[:2])
-
-        if self.selected_piece:
-            sr, sc = self.selected_piece
-            piece = self.board[sr][sc]
-        
-            if (piece.lower() == 'k' 
-                and ((self.current_player == 'w' and piece == 'K') 
-                or (self.current_player == 'b' and piece == 'k'))):
-                    player_color = 'w' if piece == 'K' else 'b'
-            
-                    if validate_castling(self.board, player_color, 'kingside', self.castling_rights):
-                        indicator_col = sc + 2
-                        screen.blit(self.move_indicator,
-                           (indicator_col * self.square_size,
-                            sr * self.square_size))
-
-                    if validate_castling(self.board, player_color, 'queenside', self.castling_rights):
-                        indicator_col = sc - 2 
-                        screen.blit(self.move_indicator,
-                           (indicator_col * self.square_size,
-                            sr * self.square_size))
-
-        if self.selected_piece:
-            sr, sc = self.selected_piece
-            pygame.draw.rect(screen, (255, 255, 0), 
-                        (sc * self.square_size,
-                         sr * self.square_size,
-                         self.square_size,
-                         self.square_size), 3)
-
-        for move in self.valid_moves:
-            if move[0] == self.selected_piece:
-                er, ec = move[1]
-                screen.blit(self.move_indicator,
-                       (ec * self.square_size,
-                        er * self.square_size))
+    def square_view(self, row, col):
+        selected = self.selected_piece == (row, col)
+        target = any(move[1] == (row, col) for move in self.valid_moves)
+        return self.board[row][col], selected, target
+
+    def draw_square(self, screen, row, col, view):
+        piece, selected, target = view
+        rect = pygame.Rect(col * self.square_size, row * self.square_size, self.square_size, self.square_size)
+        screen.blit(self.board_surface, rect, rect)
+        if piece != '-':
+            screen.blit(self.piece_images[piece], rect[:2])
+        if selected:
+            pygame.draw.rect(screen, (255, 255, 0), rect, 3)
+        if target:
+            # Castling targets are among the king's moves, so they are marked here too
+            screen.blit(self.move_indicator, rect[:2])
+        return rect
+
+    def draw_board(self, screen, full=False):
+        # Returns the rectangles that changed; nothing is drawn unless the view did
         if self.game_over:
+            if self.overlay_drawn and not full:
+                return []
+            self.drawn_squares = {}
+            for row in range(8):
+                for col in range(8):
+                    self.draw_square(screen, row, col, self.square_view(row, col))
             self.draw_game_over_overlay(screen)
+            self.overlay_drawn = True
+            return [pygame.Rect(0, 0, self.width, self.height)]
+        if not self.view_changed and not full:
+            return []
+        self.view_changed = False
+        dirty = []
+        for row in range(8):
+            for col in range(8):
+                view = self.square_view(row, col)
+                if full or self.drawn_squares.get((row, col)) != view:
+                    self.drawn_squares[row, col] = view
+                    dirty.append(self.draw_square(screen, row, col, view))
+        return dirty
 
     def draw_game_over_overlay(self,screen):
         overlay = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
@@ -112,7 +127,7 @@ class ChessGame:
             text = f"CHECKMATE! {self.get_winner_text()} WINS!"
             color = (255, 215, 0)  
         else:
-            text = "STALEMATE! GAME DRAWN"
+            text = DRAW_MESSAGES.get(self.game_result, "GAME OVER")
             color = (200, 200, 200) 
 
         text_surf = self.message_font.render(text, True, color)
@@ -147,77 +162,181 @@ class ChessGame:
             if piece != '-' and ((self.current_player == 'w' and piece.isupper()) or 
                            (self.current_player == 'b' and piece.islower())):
                 self.selected_piece = (row, col)
-                self.valid_moves = get_legal_moves(self.board, self.current_player, self.castling_rights)
+                self.valid_moves = [move for move in self.legal_moves if move[0] == clicked_pos]
         else:
-            sr, sc = self.selected_piece
-            er, ec = clicked_pos
-
-            if any(move[1] == (er, ec) for move in self.valid_moves):
-                self.board, self.castling_rights = execute_move(self.board, ((sr, sc), (er, ec)), self.castling_rights)
-            
-                self.current_player = 'b' if self.current_player == 'w' else 'w'
-            
-                white_king, black_king = check_king_status(self.board)
-                if not white_king or not black_king:
-                    self.game_over = True
+            move = (self.selected_piece, clicked_pos)
+
+            if move in self.valid_moves:
+                self.resolve_ponder(move)
+                self.make_move(move)
 
             self.selected_piece = None
             self.valid_moves = []
+        self.view_changed = True
         
     def ai_move(self):
-        if not self.game_over and self.current_player == 'b':
-            ai_move = find_best_move(self.board, depth=3, is_maximizing=False, castling_rights=self.castling_rights)
-            if ai_move:
-                self.board, self.castling_rights = execute_move(self.board, ai_move, self.castling_rights)
-                self.current_player = 'w'
-                self.check_game_over()
-            else:
-                self.game_over = True 
+        # Called every frame: starts the search on a worker thread, then polls it
+        if self.game_over or self.current_player != 'b':
+            return
+        if self.ai_search is None:
+            position = self.state.position.copy()
+            book_move = probe_book(position)
+            if book_move is not None:
+                self.play_ai_move(book_move, None)
+                return
+            self.ai_search = BackgroundSearch(self.searcher, position, max_time_ms=AI_MOVE_TIME_MS,
+                                              history=self.state.search_history())
+            return
+        if not self.ai_search.done():
+            return
+
+        _, move = self.ai_search.result
+        self.ai_search = None
+        if move is None:
+            # Only happens if the search was cancelled before its first iteration finished
+            move = encode_move(self.legal_moves[0]) if self.legal_moves else None
+        expected_reply = self.searcher.pv[1] if len(self.searcher.pv) > 1 and self.searcher.pv[0] == move else None
+        self.play_ai_move(move, expected_reply)
+
+    def play_ai_move(self, move, expected_reply):
+        if move is not None:
+            self.make_move(decode_move(move))
+            if not self.game_over and expected_reply is not None:
+                self.start_ponder(decode_move(expected_reply))
+        else:
+            # No move means no legal move, so the position itself says how the game ended
+            self.check_game_over()
+            if not self.game_over:
+                self.game_over = True
+                self.game_result = self.state.outcome()
+
+    def start_ponder(self, expected_reply):
+        # Search the position after the reply we expect while the human is thinking
+        position = self.state.position.copy()
+        position.make_move(encode_move(expected_reply))
+        history = self.state.search_history() + [self.state.position.key]
+        self.ponder_move = expected_reply
+        self.ponder_started = time.perf_counter()
+        self.ponder_search = BackgroundSearch(self.searcher, position, depth=MAX_SEARCH_DEPTH, history=history)
+
+    def resolve_ponder(self, move):
+        if self.ponder_search is None:
+            return
+        if move == self.ponder_move:
+            # Ponder hit: the running search becomes the AI's search, and the time already
+            # spent pondering counts against its budget
+            pondered_ms = (time.perf_counter() - self.ponder_started) * 1000
+            self.searcher.ponderhit(max_time_ms=max(0, AI_MOVE_TIME_MS - pondered_ms))
+            self.ai_search = self.ponder_search
+        else:
+            self.ponder_search.stop()
+        self.ponder_search = None
+        self.ponder_move = None
+
+    def stop_searches(self):
+        for search in (self.ai_search, self.ponder_search):
+            if search is not None:
+                search.stop()
+        self.ai_search = self.ponder_search = None
+        self.ponder_move = None
 
     def make_move(self, move):
-        self.board = execute_move(self.board, move, self.castling_rights)
-        self.current_player = 'b' if self.current_player == 'w' else 'w'
+        self.state.make_move(encode_move(move))
+        self.sync_with_state()
+
+    def sync_with_state(self):
+        self.board = self.state.position.to_board()
+        self.current_player = self.state.player_color
+        self.update_position_cache()
         self.check_game_over()
 
+    def takeback(self):
+        # Back to the human's previous turn: their last move, and the AI's reply if it made one
+        self.stop_searches()
+        if self.state.takeback(1 if self.current_player == 'b' else 2):
+            self.reset_game_over()
+            self.sync_with_state()
+
+    def redo(self):
+        self.stop_searches()
+        if self.state.redo(2):
+            self.reset_game_over()
+            self.sync_with_state()
+
+    def reset_game_over(self):
+        self.game_over = False
+        self.game_result = self.winner = None
+        self.overlay_drawn = False
+        self.selected_piece = None
+        self.valid_moves = []
+
+    def export_pgn(self, path=PGN_PATH):
+        with open(path, 'w') as pgn:
+            pgn.write(self.state.pgn({'White': 'Human', 'Black': 'ChessAI'}))
+
+    def is_idle(self):
+        return (self.game_over or self.current_player == 'w') and self.ai_search is None and not self.view_changed
+
     def get_winner_text(self):
         if self.winner == 'w': return "WHITE"
         if self.winner == 'b': return "BLACK"
         return ""
 
     def check_game_over(self):
-        legal_moves = get_legal_moves(self.board, self.current_player, self.castling_rights)
-        king_pos = find_king_position(self.board, self.current_player)
-        in_check = is_king_under_attack(self.board, king_pos, self.current_player, self.castling_rights)
-        
-        if not legal_moves:
+        if not self.legal_moves:
+            self.game_over = True
+            self.game_result = 'checkmate' if self.in_check else 'stalemate'
+            self.winner = 'b' if self.current_player == 'w' else 'w' if self.in_check else None
+        elif self.state.is_threefold_repetition():
+            self.game_over = True
+            self.game_result = 'repetition'
+        elif self.state.is_fifty_move_draw():
             self.game_over = True
-            self.game_result = 'checkmate' if in_check else 'stalemate'
-            self.winner = 'b' if self.current_player == 'w' else 'w' if in_check else None
+            self.game_result = 'fifty-move'
 
     def run(self):
         pygame.init()
         screen = pygame.display.set_mode((self.width, self.height))
         clock = pygame.time.Clock()
     
+        full_redraw = True
         running = True
         while running:
-            for event in pygame.event.get():
+            events = pygame.event.get()
+            if not events and self.is_idle():
+                # Nothing can change until the player does something, so sleep until they do
+                events = [pygame.event.wait()]
+            for event in events:
                 if event.type == QUIT:
                     running = False
+                elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                    # Cancel the AI's search; it plays the best move found so far
+                    if self.ai_search is not None:
+                        self.searcher.stop()
+                elif event.type == KEYDOWN and event.key == K_LEFT:
+                    self.takeback()
+                elif event.type == KEYDOWN and event.key == K_RIGHT:
+                    self.redo()
+                elif event.type == KEYDOWN and event.key == K_s:
+                    self.export_pgn()
                 elif event.type == MOUSEBUTTONDOWN:
                     if self.game_over:
                         running = False 
-                    else:
+                    elif self.ai_search is None and self.current_player == 'w':
                         self.handle_click(event.pos)
+                elif event.type == VIDEOEXPOSE:
+                    full_redraw = True
 
             if not self.game_over and self.current_player == 'b':
                 self.ai_move()
 
-            screen.fill((0,0,0))
-            self.draw_board(screen)
-            pygame.display.flip()
+            dirty = self.draw_board(screen, full_redraw)
+            full_redraw = False
+            if dirty:
+                pygame.display.update(dirty)
             clock.tick(60)
 
+        self.stop_searches()
         pygame.quit()
 
 if __name__ == "__main__":
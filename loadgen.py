@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import time
+from bench import BENCH_POSITIONS, random_positions
+from constants import MAX_SEARCH_DEPTH
+from server import DEFAULT_HOST, DEFAULT_PORT, percentile
+
+
+async def client(host, port, requests, limits, latencies, outcomes):
+    # One connection sending its share of the requests one after another
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for index, fen in requests:
+            start = time.perf_counter()
+            writer.write((json.dumps(dict(limits, id=index, fen=fen)) + '\n').encode())
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latency = (time.perf_counter() - start) * 1000
+            if 'error' in response:
+                outcome = 'rejected' if response['error'] == 'busy' else 'errors'
+            else:
+                outcome = 'cached' if response['cached'] else 'searched'
+            # A busy reply comes back at once, so it is only counted, not timed
+            if outcome != 'rejected':
+                latencies.append(latency)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    finally:
+        writer.close()
+
+
+async def fetch_metrics(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"command": "metrics"}\n')
+    metrics = json.loads(await reader.readline())
+    writer.close()
+    return metrics
+
+
+async def run_cancel(fens, searches=None, hold_ms=200, timeout=10.0, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    # Starts searches with no limit but depth, which only a stop flag can end, resets their
+    # connections and waits until the server has seen every worker give its search up
+    before = await fetch_metrics(host, port)
+    searches = min(searches or before['workers'], before['queue_limit'])
+    connections = []
+    for index in range(searches):
+        reader, writer = await asyncio.open_connection(host, port)
+        # A different depth for every pass over fens keeps the requests from being merged
+        request = {'id': index, 'fen': fens[index % len(fens)], 'depth': MAX_SEARCH_DEPTH - index // len(fens)}
+        writer.write((json.dumps(request) + '\n').encode())
+        await writer.drain()
+        connections.append(writer)
+    await asyncio.sleep(hold_ms / 1000)
+    start = time.perf_counter()
+    for writer in connections:
+        # A plain close reads as end of input, which the server still answers; a linger of zero
+        # makes the close a reset
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        writer.close()
+    expected = before['stop_ms']['samples'] + searches
+    while True:
+        metrics = await fetch_metrics(host, port)
+        elapsed = time.perf_counter() - start
+        if metrics['stop_ms']['samples'] >= expected or elapsed >= timeout:
+            break
+        await asyncio.sleep(0.01)
+    return {'searches': searches, 'hold_ms': hold_ms, 'stopped': metrics['stop_ms']['samples'] >= expected,
+            'all_stopped_ms': round(elapsed * 1000, 3), 'server_stop_ms': metrics['stop_ms'],
+            'cancelled': metrics['cancelled'] - before['cancelled']}
+
+
+async def run_load(fens, total, concurrency, limits, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    # Sends total requests cycling through fens over concurrency connections; latency is measured
+    # at the client, so it includes queueing in the server, for every request not turned away
+    requests = [(index, fens[index % len(fens)]) for index in range(total)]
+    latencies = []
+    outcomes = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, requests[offset::concurrency], limits, latencies, outcomes)
+                           for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    metrics = await fetch_metrics(host, port)
+    return {'requests': total, 'concurrency': concurrency, 'limits': limits, 'positions': len(fens),
+            'time': round(elapsed, 6), 'throughput': round(total / elapsed, 3) if elapsed else 0,
+            'latency_ms': {'p50': round(percentile(latencies, 0.5), 3) if latencies else None,
+                           'p99': round(percentile(latencies, 0.99), 3) if latencies else None,
+                           'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                           'samples': len(latencies)},
+            'outcomes': outcomes, 'server': metrics}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the analysis server and report latency and throughput")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8, help="connections sending requests at once")
+    parser.add_argument('--depth', type=int)
+    parser.add_argument('--movetime', type=int, help="time budget per request in milliseconds")
+    parser.add_argument('--random', type=int, default=0,
+                        help="use this many random positions instead of the benchmark positions")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cancel', type=int, nargs='?', const=0, metavar='SEARCHES',
+                        help="instead of loading the server, time how fast cancelled searches stop "
+                             "(default: one search per server worker)")
+    parser.add_argument('--hold', type=int, default=200, help="milliseconds a search runs before it is cancelled")
+    args = parser.parse_args()
+
+    if args.random:
+        fens = [position.fen() for position in random_positions(args.random, args.seed)]
+    else:
+        fens = list(BENCH_POSITIONS.values())
+    if args.cancel is not None:
+        report = asyncio.run(run_cancel(fens, args.cancel, args.hold, host=args.host, port=args.port))
+        print(json.dumps(report, indent=2))
+        if not report['stopped']:
+            raise SystemExit(1)
+        return
+    limits = {}
+    if args.depth is not None:
+        limits['depth'] = args.depth
+    if args.movetime is not None:
+        limits['time_ms'] = args.movetime
+    if not limits:
+        limits['depth'] = 3
+    report = asyncio.run(run_load(fens, args.requests, args.concurrency, limits, args.host, args.port))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import json
+import math
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from engine import *
+from game import GameState, START_FEN
+
+# Engine against engine games for regression testing. Each opening is played twice with the
+# engines swapping colours, games run on a process pool, and an SPRT decides when to stop.
+OPENINGS = [
+    START_FEN,
+    'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pppp1ppp/8/4p3/2P5/8/PP1PPPPP/RNBQKBNR w KQkq - 0 2',
+    'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8',
+]
+# Limits an engine configuration may set; every other key is a Searcher option
+LIMIT_KEYS = ('depth', 'time_ms', 'nodes')
+DEFAULT_ENGINE = {'depth': 3}
+# Adjudication: a game this long is a draw, and one both engines have scored at least this far
+# from level for this many plies in a row goes to the side ahead
+MAX_PLIES = 300
+RESIGN_SCORE = 10
+RESIGN_PLIES = 8
+# Games kept in flight per worker, so a decided match does not leave many queued games behind
+QUEUE_PER_WORKER = 2
+# SPRT defaults: H0 is elo0, H1 is elo1, with these error rates
+SPRT_ELO0, SPRT_ELO1 = 0, 10
+SPRT_ALPHA = SPRT_BETA = 0.05
+# A one-sided run has no spread to measure, so the score variance never drops below this
+MIN_VARIANCE = 0.01
+
+_match_searchers = {}
+
+
+def parse_engine(text):
+    config = json.loads(text) if text else dict(DEFAULT_ENGINE)
+    if not isinstance(config, dict):
+        raise ValueError(f"Engine configuration must be a JSON object: {text}")
+    config.setdefault('name', ' '.join(f"{key}={value}" for key, value in config.items()))
+    return config
+
+
+def _searcher_for(config):
+    # One Searcher per configuration in each worker; cleared per game so games stay independent
+    options = {key: value for key, value in config.items() if key not in LIMIT_KEYS and key != 'name'}
+    key = json.dumps(options, sort_keys=True)
+    if key not in _match_searchers:
+        _match_searchers[key] = Searcher(**options)
+    return _match_searchers[key]
+
+
+def play_game(index, fen, white, black, max_plies=MAX_PLIES):
+    # Plays one game in a pool process; returns its result, PGN and per-engine counters
+    state = GameState.from_fen(fen)
+    engines = {1: white, -1: black}
+    searchers = {side: _searcher_for(config) for side, config in engines.items()}
+    for searcher in set(searchers.values()):
+        searcher.table.clear()
+    totals = {side: {'nodes': 0, 'time': 0.0, 'moves': 0} for side in (1, -1)}
+    # Scores from white's point of view, latest last
+    scores = []
+    result = termination = None
+    while result is None:
+        outcome = state.outcome()
+        if outcome is not None:
+            result, termination = state.result(), outcome
+            break
+        position = state.position
+        if position.pieces == 2:
+            result, termination = '1/2-1/2', 'insufficient material'
+            break
+        if state.ply >= max_plies:
+            result, termination = '1/2-1/2', 'max plies'
+            break
+        side = position.side
+        config = engines[side]
+        searcher = searchers[side]
+        start = time.perf_counter()
+        score, move = searcher.find_best_move(position.copy(), config.get('depth'), config.get('time_ms'),
+                                              config.get('nodes'), history=state.search_history())
+        elapsed = time.perf_counter() - start
+        totals[side]['nodes'] += searcher.nodes
+        totals[side]['time'] += elapsed
+        totals[side]['moves'] += 1
+        if move is None:
+            move = position.legal_moves()[0]
+        state.make_move(move)
+        scores.append(score * side)
+        recent = scores[-RESIGN_PLIES:]
+        if len(recent) == RESIGN_PLIES:
+            if min(recent) >= RESIGN_SCORE:
+                result, termination = '1-0', 'adjudication'
+            elif max(recent) <= -RESIGN_SCORE:
+                result, termination = '0-1', 'adjudication'
+
+    players = {}
+    for side, name in ((1, 'white'), (-1, 'black')):
+        side_totals = totals[side]
+        players[name] = {'engine': engines[side]['name'], 'nodes': side_totals['nodes'],
+                         'time': round(side_totals['time'], 6), 'moves': side_totals['moves'],
+                         'nps': int(side_totals['nodes'] / side_totals['time']) if side_totals['time'] else 0}
+    headers = {'Event': 'ChessAI match', 'Round': str(index + 1),
+               'White': white['name'], 'Black': black['name'], 'Termination': termination}
+    for name, prefix in (('white', 'White'), ('black', 'Black')):
+        for counter, tag in (('nodes', 'Nodes'), ('time', 'Time'), ('nps', 'NPS')):
+            headers[prefix + tag] = str(players[name][counter])
+    return {'index': index, 'fen': fen, 'result': result, 'termination': termination, 'plies': state.ply,
+            'white': players['white'], 'black': players['black'], 'pgn': state.pgn(headers, result)}
+
+
+def elo_difference(score):
+    # The Elo difference a score fraction corresponds to under the logistic model
+    if score <= 0:
+        return -float('inf')
+    if score >= 1:
+        return float('inf')
+    return -400 * math.log10(1 / score - 1)
+
+
+def _format_elo(score):
+    elo = elo_difference(score)
+    return format_score(elo if abs(elo) == float('inf') else round(elo, 1))
+
+
+def _expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def sprt_llr(wins, draws, losses, elo0=SPRT_ELO0, elo1=SPRT_ELO1):
+    # Log likelihood ratio of H1 (elo1) over H0 (elo0), using the normal approximation with
+    # the variance of the observed game scores
+    games = wins + draws + losses
+    if not games:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = max(MIN_VARIANCE, (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    score0, score1 = _expected_score(elo0), _expected_score(elo1)
+    return (score1 - score0) * (2 * score - score0 - score1) * games / (2 * variance)
+
+
+def sprt_bounds(alpha=SPRT_ALPHA, beta=SPRT_BETA):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def summarise(wins, draws, losses, elo0=SPRT_ELO0, elo1=SPRT_ELO1, alpha=SPRT_ALPHA, beta=SPRT_BETA):
+    # Score, Elo with a 95% interval, and the SPRT state, all from engine A's point of view
+    games = wins + draws + losses
+    summary = {'games': games, 'wins': wins, 'draws': draws, 'losses': losses}
+    if not games:
+        return summary
+    score = (wins + draws / 2) / games
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+    llr = sprt_llr(wins, draws, losses, elo0, elo1)
+    lower, upper = sprt_bounds(alpha, beta)
+    summary.update({'score': round(score, 4), 'elo': _format_elo(score),
+                    'elo_interval': [_format_elo(score - margin), _format_elo(score + margin)],
+                    'sprt': {'elo0': elo0, 'elo1': elo1, 'llr': round(llr, 3),
+                             'bounds': [round(lower, 3), round(upper, 3)],
+                             'decision': 'H1' if llr >= upper else 'H0' if llr <= lower else None}})
+    return summary
+
+
+def run_match(engine_a, engine_b, games, openings=OPENINGS, workers=2, max_plies=MAX_PLIES, sprt=True,
+              elo0=SPRT_ELO0, elo1=SPRT_ELO1, alpha=SPRT_ALPHA, beta=SPRT_BETA, pgn_output=None, progress=None):
+    # Game 2k plays opening k with A as white, game 2k + 1 the same opening with colours swapped.
+    # Games already running when the SPRT decides are played out and counted.
+    counts = {'wins': 0, 'draws': 0, 'losses': 0}
+    results = []
+    decided = False
+    with ProcessPoolExecutor(workers) as pool:
+        pending = {}
+        next_game = 0
+        while True:
+            while not decided and next_game < games and len(pending) < workers * QUEUE_PER_WORKER:
+                fen = openings[next_game // 2 % len(openings)]
+                white, black = (engine_a, engine_b) if next_game % 2 == 0 else (engine_b, engine_a)
+                pending[pool.submit(play_game, next_game, fen, white, black, max_plies)] = next_game
+                next_game += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                game = future.result()
+                a_is_white = index % 2 == 0
+                if game['result'] == '1/2-1/2':
+                    counts['draws'] += 1
+                elif (game['result'] == '1-0') == a_is_white:
+                    counts['wins'] += 1
+                else:
+                    counts['losses'] += 1
+                results.append(game)
+                if pgn_output is not None:
+                    pgn_output.write(game['pgn'] + '\n')
+                    pgn_output.flush()
+                summary = summarise(counts['wins'], counts['draws'], counts['losses'], elo0, elo1, alpha, beta)
+                if progress is not None:
+                    progress(game, summary)
+                if sprt and summary['sprt']['decision'] is not None:
+                    decided = True
+    results.sort(key=lambda game: game['index'])
+    summary = summarise(counts['wins'], counts['draws'], counts['losses'], elo0, elo1, alpha, beta)
+    for name, engine in (('engine_a', engine_a), ('engine_b', engine_b)):
+        nodes = seconds = 0
+        for game in results:
+            for side in ('white', 'black'):
+                if game[side]['engine'] == engine['name']:
+                    nodes += game[side]['nodes']
+                    seconds += game[side]['time']
+        summary[name] = {'config': engine, 'nodes': nodes, 'time': round(seconds, 6),
+                         'nps': int(nodes / seconds) if seconds else 0}
+    return summary, results
+
+
+def read_openings(path):
+    with open(path) as openings:
+        return [line.strip() for line in openings if line.strip() and not line.startswith('#')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other")
+    parser.add_argument('--engine-a', help=f"JSON with depth, time_ms, nodes and Searcher options (default: {json.dumps(DEFAULT_ENGINE)})")
+    parser.add_argument('--engine-b', help="configuration of the engine A is compared against")
+    parser.add_argument('--games', type=int, default=200, help="most games to play")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--openings', help="file with one opening FEN per line (default: a built-in set)")
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help="plies after which a game is drawn")
+    parser.add_argument('--pgn', help="file to write the games to")
+    parser.add_argument('--no-sprt', action='store_true', help="play all games instead of stopping on a decision")
+    parser.add_argument('--elo0', type=float, default=SPRT_ELO0)
+    parser.add_argument('--elo1', type=float, default=SPRT_ELO1)
+    parser.add_argument('--alpha', type=float, default=SPRT_ALPHA)
+    parser.add_argument('--beta', type=float, default=SPRT_BETA)
+    parser.add_argument('--quiet', action='store_true', help="do not report each game on stderr")
+    args = parser.parse_args()
+
+    engine_a = parse_engine(args.engine_a)
+    engine_b = parse_engine(args.engine_b)
+    if engine_a['name'] == engine_b['name']:
+        engine_a['name'], engine_b['name'] = 'A ' + engine_a['name'], 'B ' + engine_b['name']
+    openings = read_openings(args.openings) if args.openings else OPENINGS
+
+    def progress(game, summary):
+        print(f"game {game['index'] + 1}: {game['result']} ({game['termination']}, {game['plies']} plies) "
+              f"+{summary['wins']} ={summary['draws']} -{summary['losses']} elo {summary['elo']} "
+              f"llr {summary['sprt']['llr']}", file=sys.stderr)
+
+    pgn_output = open(args.pgn, 'w') if args.pgn else None
+    try:
+        summary, results = run_match(engine_a, engine_b, args.games, openings, args.workers, args.max_plies,
+                                     not args.no_sprt, args.elo0, args.elo1, args.alpha, args.beta, pgn_output,
+                                     None if args.quiet else progress)
+    finally:
+        if pgn_output is not None:
+            pgn_output.close()
+    summary['results'] = [{key: value for key, value in game.items() if key != 'pgn'} for game in results]
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import json
+import time
+from engine import *
+from position import Position, SIDE_COLORS, move_name
+
+STANDARD_POSITIONS = {
+    'startpos': 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'kiwipete': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'position3': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'position4': 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'position5': 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'position6': 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P3/2NP1N2/PPP2PPP/R4RK1 w - - 0 10',
+}
+
+
+def perft(position, depth):
+    if depth == 0:
+        return 1
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    counts = {}
+    for move in position.legal_moves():
+        position.make_move(move)
+        counts[move_name(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+
+def run_perft(fen, depth, split=False, position_class=Position):
+    position = position_class.from_fen(fen)
+    start = time.perf_counter()
+    if split:
+        counts = divide(position, depth)
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    result = {'fen': fen, 'depth': depth, 'nodes': nodes, 'time': round(elapsed, 6),
+              'nps': int(nodes / elapsed) if elapsed else 0}
+    if split:
+        result['divide'] = counts
+    return result
+
+
+# Reference implementation: the original list based filter that copies the board
+# for every pseudo-legal move and scans all opponent moves for the king square
+
+def reference_is_king_under_attack(chessboard, king_position, player_color, castling_rights):
+    opponent_color = 'b' if player_color == 'w' else 'w'
+    opponent_moves = get_pseudo_legal_moves(chessboard, opponent_color, castling_rights, include_castling=False)
+    return any(move[1] == king_position for move in opponent_moves)
+
+
+def reference_validate_castling(board, player_color, side, castling_rights):
+    row = 7 if player_color == 'w' else 0
+    king_col = 4
+    rook_col = 7 if side == 'kingside' else 0
+    step = 1 if side == 'kingside' else -1
+
+    if not castling_rights[player_color][side]:
+        return False
+    if board[row][king_col].lower() != 'k' or board[row][rook_col].lower() != 'r':
+        return False
+    for col in range(min(king_col, rook_col) + 1, max(king_col, rook_col)):
+        if board[row][col] != '-':
+            return False
+    if reference_is_king_under_attack(board, (row, king_col), player_color, castling_rights):
+        return False
+    for i in (1, 2):
+        new_col = king_col + step * i
+        temp_board, new_castling = execute_move(board, ((row, king_col), (row, new_col)), castling_rights)
+        if reference_is_king_under_attack(temp_board, (row, new_col), player_color, new_castling):
+            return False
+    return True
+
+
+def reference_legal_moves(chessboard, player_color, castling_rights):
+    pseudolegal_moves = get_pseudo_legal_moves(chessboard, player_color, castling_rights, include_castling=False)
+    row = 7 if player_color == 'w' else 0
+    if chessboard[row][4] == ('K' if player_color == 'w' else 'k'):
+        castling_moves = []
+        if reference_validate_castling(chessboard, player_color, 'kingside', castling_rights):
+            castling_moves.append(((row, 4), (row, 6)))
+        if reference_validate_castling(chessboard, player_color, 'queenside', castling_rights):
+            castling_moves.append(((row, 4), (row, 2)))
+        # Castling follows the ordinary king moves, as in generate_king_moves
+        index = sum(1 for move in pseudolegal_moves if move[0] <= (row, 4))
+        pseudolegal_moves[index:index] = castling_moves
+
+    legal_moves = []
+    for move in pseudolegal_moves:
+        new_board, new_castling = execute_move(chessboard, move, castling_rights)
+        king_pos = find_king_position(new_board, player_color)
+        if king_pos and not reference_is_king_under_attack(new_board, king_pos, player_color, new_castling):
+            legal_moves.append(move)
+    return legal_moves
+
+
+def reference_perft(chessboard, player_color, castling_rights, depth):
+    if depth == 0:
+        return 1
+    moves = reference_legal_moves(chessboard, player_color, castling_rights)
+    if depth == 1:
+        return len(moves)
+    next_color = 'b' if player_color == 'w' else 'w'
+    nodes = 0
+    for move in moves:
+        new_board, new_castling = execute_move(chessboard, move, castling_rights)
+        nodes += reference_perft(new_board, next_color, new_castling, depth - 1)
+    return nodes
+
+
+def verify(depth, positions=STANDARD_POSITIONS, position_class=Position):
+    ok = True
+    for name, fen in positions.items():
+        position = position_class.from_fen(fen)
+        board, color, rights = position.to_board(), SIDE_COLORS[position.side], position.castling_rights()
+        for current_depth in range(1, depth + 1):
+            start = time.perf_counter()
+            nodes = perft(position, current_depth)
+            elapsed = time.perf_counter() - start
+            expected = reference_perft(board, color, rights, current_depth)
+            status = 'ok' if nodes == expected else 'MISMATCH'
+            ok = ok and nodes == expected
+            print(f"{name} depth {current_depth}: {nodes} (reference {expected}) {elapsed:.3f}s {status}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the legal move tree")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fen', help="position to count from (default: the standard perft positions)")
+    parser.add_argument('--position', choices=sorted(STANDARD_POSITIONS), help="one of the standard positions")
+    parser.add_argument('--divide', action='store_true', help="report the node count under each root move")
+    parser.add_argument('--verify', action='store_true',
+                        help="compare against the original list based move filter on the standard positions")
+    parser.add_argument('--backend', choices=sorted(POSITION_BACKENDS), default=POSITION_BACKEND,
+                        help="board representation to generate moves with")
+    args = parser.parse_args()
+
+    position_class = POSITION_BACKENDS[args.backend]
+    if args.verify:
+        raise SystemExit(0 if verify(args.depth, position_class=position_class) else 1)
+    if args.fen:
+        fens = {'fen': args.fen}
+    elif args.position:
+        fens = {args.position: STANDARD_POSITIONS[args.position]}
+    else:
+        fens = STANDARD_POSITIONS
+    results = []
+    for name, fen in fens.items():
+        result = run_perft(fen, args.depth, args.divide, position_class)
+        result['name'] = name
+        results.append(result)
+    nodes = sum(result['nodes'] for result in results)
+    elapsed = sum(result['time'] for result in results)
+    print(json.dumps({'backend': args.backend, 'results': results, 'nodes': nodes, 'time': round(elapsed, 6),
+                      'nps': int(nodes / elapsed) if elapsed else 0}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
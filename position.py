@@ -0,0 +1,761 @@
+import random
+from constants import PIECE_VALUES, PAWN_POSITION_VALUES, KNIGHT_POSITION_VALUES, BISHOP_POSITION_VALUES, \
+    ROOK_POSITION_VALUES, QUEEN_POSITION_VALUES, KING_POSITION_VALUES
+
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+
+# Piece codes are small ints: positive for white, negative for black. Tables
+# indexed by piece are 13 entries long laid out as 0..6, -6..-1 so that
+# table[piece] works directly for negative (black) codes.
+PIECE_CHARS = '-PNBRQKkqrbnp'
+PIECE_CODES = {char: index if index <= KING else index - 13 for index, char in enumerate(PIECE_CHARS)}
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLING_BITS = {
+    'w': {'kingside': WHITE_KINGSIDE, 'queenside': WHITE_QUEENSIDE},
+    'b': {'kingside': BLACK_KINGSIDE, 'queenside': BLACK_QUEENSIDE}
+}
+SIDE_CASTLING = {1: WHITE_KINGSIDE | WHITE_QUEENSIDE, -1: BLACK_KINGSIDE | BLACK_QUEENSIDE}
+SIDE_COLORS = {1: 'w', -1: 'b'}
+COLOR_SIDES = {'w': 1, 'b': -1}
+KING_HOMES = {1: 60, -1: 4}
+# Never a real move: both squares are a8
+NULL_MOVE = 0
+
+
+def square_of(row, col):
+    return row * 8 + col
+
+
+def encode_move(move):
+    (start_row, start_col), (end_row, end_col) = move
+    return (start_row * 8 + start_col) | (end_row * 8 + end_col) << 6
+
+
+def decode_move(move):
+    start, end = move & 63, move >> 6 & 63
+    return (start >> 3, start & 7), (end >> 3, end & 7)
+
+
+def square_name(sq):
+    return 'abcdefgh'[sq & 7] + str(8 - (sq >> 3))
+
+
+def parse_square(name):
+    return (8 - int(name[1])) * 8 + 'abcdefgh'.index(name[0])
+
+
+def move_name(move):
+    return square_name(move & 63) + square_name(move >> 6 & 63)
+
+
+def parse_san(position, san):
+    # Returns the legal move written in standard algebraic notation, or None. Promotions
+    # have no equivalent in this engine and are never matched.
+    san = san.rstrip('+#!?')
+    legal = position.legal_moves()
+    if san in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        king = KING_HOMES[position.side]
+        move = king | (king + (2 if len(san) == 3 else -2)) << 6
+        return move if move in legal and position.board[king] == KING * position.side else None
+    if '=' in san or len(san) < 2:
+        return None
+    piece = 'PNBRQK'.index(san[0]) + 1 if san[0] in 'NBRQK' else PAWN
+    text = san[1:] if piece != PAWN else san
+    text = text.replace('x', '')
+    try:
+        target = parse_square(text[-2:])
+    except (ValueError, IndexError):
+        return None
+    hint = text[:-2]
+    matches = []
+    for move in legal:
+        start = move & 63
+        if move >> 6 != target or position.board[start] != piece * position.side:
+            continue
+        name = square_name(start)
+        if all(char in name for char in hint):
+            matches.append(move)
+    return matches[0] if len(matches) == 1 else None
+
+
+def move_san(position, move):
+    # Standard algebraic notation for a legal move, the reverse of parse_san
+    board = position.board
+    start, end = move & 63, move >> 6 & 63
+    piece = board[start]
+    kind = piece * position.side
+    if kind == KING and abs(end - start) == 2:
+        text = 'O-O' if end > start else 'O-O-O'
+    elif kind == PAWN:
+        text = (square_name(start)[0] + 'x' if board[end] else '') + square_name(end)
+    else:
+        # Name the file, else the rank, else both when another such piece could go there too
+        others = [other & 63 for other in position.legal_moves()
+                  if other >> 6 == end and other != move and board[other & 63] == piece]
+        hint = ''
+        if others:
+            if all(other & 7 != start & 7 for other in others):
+                hint = square_name(start)[0]
+            elif all(other >> 3 != start >> 3 for other in others):
+                hint = square_name(start)[1]
+            else:
+                hint = square_name(start)
+        text = 'PNBRQK'[kind - 1] + hint + ('x' if board[end] else '') + square_name(end)
+    position.make_move(move)
+    if position.in_check():
+        text += '+' if position.legal_moves() else '#'
+    position.unmake_move()
+    return text
+
+
+def _targets(offsets):
+    table = []
+    for sq in range(64):
+        row, col = sq >> 3, sq & 7
+        table.append(tuple((row + dr) * 8 + col + dc for dr, dc in offsets
+                           if 0 <= row + dr < 8 and 0 <= col + dc < 8))
+    return table
+
+
+def _rays(directions):
+    table = []
+    for sq in range(64):
+        rays = []
+        for dr, dc in directions:
+            ray = []
+            row, col = (sq >> 3) + dr, (sq & 7) + dc
+            while 0 <= row < 8 and 0 <= col < 8:
+                ray.append(row * 8 + col)
+                row, col = row + dr, col + dc
+            rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return table
+
+
+# Offsets and directions keep the order used by the list based generators in engine.py
+KNIGHT_TARGETS = _targets([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_TARGETS = _targets([(1, 1), (1, -1), (-1, 1), (-1, -1), (1, 0), (-1, 0), (0, 1), (0, -1)])
+PAWN_CAPTURES = {1: _targets([(-1, -1), (-1, 1)]), -1: _targets([(1, -1), (1, 1)])}
+# Squares a pawn of the given side has to stand on to attack a square
+PAWN_ATTACKERS = {1: PAWN_CAPTURES[-1], -1: PAWN_CAPTURES[1]}
+BISHOP_RAYS = _rays([(1, 1), (1, -1), (-1, 1), (-1, -1)])
+ROOK_RAYS = _rays([(1, 0), (-1, 0), (0, 1), (0, -1)])
+QUEEN_RAYS = [BISHOP_RAYS[sq] + ROOK_RAYS[sq] for sq in range(64)]
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+ALL_SQUARES = (1 << 64) - 1
+PAWN_STEPS = {1: -8, -1: 8}
+PAWN_START_ROWS = {1: 6, -1: 1}
+
+POSITION_VALUES = {
+    PAWN: PAWN_POSITION_VALUES, KNIGHT: KNIGHT_POSITION_VALUES, BISHOP: BISHOP_POSITION_VALUES,
+    ROOK: ROOK_POSITION_VALUES, QUEEN: QUEEN_POSITION_VALUES, KING: KING_POSITION_VALUES
+}
+
+
+def _piece_square_values(piece):
+    if piece == EMPTY:
+        return [0] * 64
+    table = POSITION_VALUES[abs(piece)]
+    # Same lookup as engine.get_positional_values: black reads the table flipped
+    return [PIECE_VALUES[PIECE_CHARS[piece]] + (table[sq >> 3] if piece > 0 else table[7 - (sq >> 3)])[sq & 7]
+            for sq in range(64)]
+
+
+# Plain material by piece code, for exchange evaluation
+EXCHANGE_VALUES = [abs(PIECE_VALUES.get(char, 0)) for char in PIECE_CHARS]
+
+# Material plus positional value for every piece on every square, in the
+# board's piece-indexed layout
+PIECE_SQUARE_VALUES = [_piece_square_values(piece) for piece in list(range(7)) + list(range(-6, 0))]
+
+_zobrist_random = random.Random(0x5EED)
+
+
+def _zobrist_squares():
+    return [_zobrist_random.getrandbits(64) for _ in range(64)]
+
+
+ZOBRIST_PIECES = [[0] * 64] + [_zobrist_squares() for _ in range(12)]
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+_zobrist_castling_bits = [_zobrist_random.getrandbits(64) for _ in range(4)]
+ZOBRIST_CASTLING = []
+for _mask in range(16):
+    _key = 0
+    for _bit in range(4):
+        if _mask & 1 << _bit:
+            _key ^= _zobrist_castling_bits[_bit]
+    ZOBRIST_CASTLING.append(_key)
+
+
+class Position:
+    __slots__ = ('board', 'side', 'castling', 'kings', 'pieces', 'key', 'score', 'stack')
+
+    def __init__(self, board, side=1, castling=0):
+        self.board = board
+        self.side = side
+        self.castling = castling
+        self.kings = {1: None, -1: None}
+        self.pieces = 64 - board.count(EMPTY)
+        for sq, piece in enumerate(board):
+            if piece == KING:
+                self.kings[1] = sq
+            elif piece == -KING:
+                self.kings[-1] = sq
+        self.key = self.compute_key()
+        self.score = self.compute_score()
+        self.stack = []
+
+    @classmethod
+    def from_board(cls, chessboard, player_color='w', castling_rights=None):
+        board = [PIECE_CODES.get(piece, EMPTY) for row in chessboard for piece in row]
+        castling = 0
+        if castling_rights is not None:
+            for color, sides in CASTLING_BITS.items():
+                for side, bit in sides.items():
+                    if castling_rights[color][side]:
+                        castling |= bit
+        return cls(board, COLOR_SIDES[player_color], castling)
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        board = []
+        for char in fields[0]:
+            if char.isdigit():
+                board.extend([EMPTY] * int(char))
+            elif char in PIECE_CODES and char != '-':
+                board.append(PIECE_CODES[char])
+            elif char != '/':
+                raise ValueError(f"Invalid FEN placement: {fields[0]}")
+        if len(board) != 64:
+            raise ValueError(f"Invalid FEN placement: {fields[0]}")
+        if len(fields) > 1 and fields[1] not in COLOR_SIDES:
+            raise ValueError(f"Invalid FEN side to move: {fields[1]}")
+        side = COLOR_SIDES[fields[1]] if len(fields) > 1 else 1
+        castling = 0
+        if len(fields) > 2:
+            for char, bit in (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE), ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE)):
+                if char in fields[2]:
+                    castling |= bit
+        return cls(board, side, castling)
+
+    def fen(self):
+        rows = []
+        for row in range(8):
+            text = ''
+            empty = 0
+            for piece in self.board[row * 8:row * 8 + 8]:
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += PIECE_CHARS[piece]
+            rows.append(text + (str(empty) if empty else ''))
+        castling = ''.join(char for char, bit in (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE),
+                                                  ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE))
+                           if self.castling & bit)
+        return f"{'/'.join(rows)} {SIDE_COLORS[self.side]} {castling or '-'} - 0 1"
+
+    def to_board(self):
+        return [[PIECE_CHARS[piece] for piece in self.board[row * 8:row * 8 + 8]] for row in range(8)]
+
+    def castling_rights(self):
+        return {color: {side: bool(self.castling & bit) for side, bit in sides.items()}
+                for color, sides in CASTLING_BITS.items()}
+
+    def compute_key(self):
+        key = ZOBRIST_CASTLING[self.castling]
+        if self.side == -1:
+            key ^= ZOBRIST_SIDE
+        for sq, piece in enumerate(self.board):
+            if piece:
+                key ^= ZOBRIST_PIECES[piece][sq]
+        return key
+
+    def compute_score(self):
+        total_score = 0
+        for sq, piece in enumerate(self.board):
+            if piece:
+                total_score += PIECE_SQUARE_VALUES[piece][sq]
+        return total_score
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.board = self.board[:]
+        position.side = self.side
+        position.castling = self.castling
+        position.kings = dict(self.kings)
+        position.pieces = self.pieces
+        position.key = self.key
+        position.score = self.score
+        position.stack = []
+        return position
+
+    def make_move(self, move):
+        board = self.board
+        side = self.side
+        start = move & 63
+        end = move >> 6 & 63
+        piece = board[start]
+        captured = board[end]
+        castling = new_castling = self.castling
+        key = self.key
+        score = self.score
+        corner = EMPTY
+        board[end] = piece
+        board[start] = EMPTY
+        pieces_keys = ZOBRIST_PIECES[piece]
+        new_key = key ^ pieces_keys[start] ^ pieces_keys[end] ^ ZOBRIST_SIDE
+        values = PIECE_SQUARE_VALUES[piece]
+        new_score = score + values[end] - values[start]
+        if captured:
+            new_key ^= ZOBRIST_PIECES[captured][end]
+            new_score -= PIECE_SQUARE_VALUES[captured][end]
+            self.pieces -= 1
+            if captured == -KING * side:
+                self.kings[-side] = None
+        kind = piece * side
+        if kind == KING:
+            self.kings[side] = end
+            new_castling = castling & ~SIDE_CASTLING[side]
+            if end - start == 2:
+                corner = board[start + 3]
+                board[start + 1] = ROOK * side
+                board[start + 3] = EMPTY
+                new_key ^= ZOBRIST_PIECES[corner][start + 3] ^ ZOBRIST_PIECES[ROOK * side][start + 1]
+                new_score += PIECE_SQUARE_VALUES[ROOK * side][start + 1] - PIECE_SQUARE_VALUES[corner][start + 3]
+            elif start - end == 2:
+                corner = board[start - 4]
+                board[start - 1] = ROOK * side
+                board[start - 4] = EMPTY
+                new_key ^= ZOBRIST_PIECES[corner][start - 4] ^ ZOBRIST_PIECES[ROOK * side][start - 1]
+                new_score += PIECE_SQUARE_VALUES[ROOK * side][start - 1] - PIECE_SQUARE_VALUES[corner][start - 4]
+        elif kind == ROOK:
+            # Any rook leaving the h or a file drops that side's right, as execute_move does
+            if start & 7 == 7:
+                new_castling = castling & ~(WHITE_KINGSIDE if side == 1 else BLACK_KINGSIDE)
+            elif start & 7 == 0:
+                new_castling = castling & ~(WHITE_QUEENSIDE if side == 1 else BLACK_QUEENSIDE)
+        if new_castling != castling:
+            new_key ^= ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[new_castling]
+            self.castling = new_castling
+        self.stack.append((move, captured, castling, corner, key, score))
+        self.key = new_key
+        self.score = new_score
+        self.side = -side
+
+    def unmake_move(self):
+        move, captured, castling, corner, key, score = self.stack.pop()
+        board = self.board
+        side = -self.side
+        start = move & 63
+        end = move >> 6 & 63
+        piece = board[end]
+        board[start] = piece
+        board[end] = captured
+        if captured:
+            self.pieces += 1
+            if captured == -KING * side:
+                self.kings[-side] = end
+        if piece * side == KING:
+            self.kings[side] = start
+            if end - start == 2:
+                board[start + 1] = EMPTY
+                board[start + 3] = corner
+            elif start - end == 2:
+                board[start - 1] = EMPTY
+                board[start - 4] = corner
+        self.castling = castling
+        self.key = key
+        self.score = score
+        self.side = side
+
+    def make_null_move(self):
+        # Passes the turn; used by null-move pruning, undone with unmake_null_move
+        self.stack.append((NULL_MOVE, EMPTY, self.castling, EMPTY, self.key, self.score))
+        self.key ^= ZOBRIST_SIDE
+        self.side = -self.side
+
+    def unmake_null_move(self):
+        _, _, _, _, key, _ = self.stack.pop()
+        self.key = key
+        self.side = -self.side
+
+    def unwind(self, length):
+        # Takes back moves, null moves included, until the stack is length entries long
+        while len(self.stack) > length:
+            if self.stack[-1][0] == NULL_MOVE:
+                self.unmake_null_move()
+            else:
+                self.unmake_move()
+
+    def has_pieces(self, side):
+        # Whether side has anything besides king and pawns, the usual guard against zugzwang
+        for piece in self.board:
+            kind = piece * side
+            if PAWN < kind < KING:
+                return True
+        return False
+
+    def is_attacked(self, sq, by_side):
+        # Look outward from the target square for the first piece that could reach it
+        board = self.board
+        pawn = PAWN * by_side
+        for origin in PAWN_ATTACKERS[by_side][sq]:
+            if board[origin] == pawn:
+                return True
+        knight = KNIGHT * by_side
+        for origin in KNIGHT_TARGETS[sq]:
+            if board[origin] == knight:
+                return True
+        king = KING * by_side
+        for origin in KING_TARGETS[sq]:
+            if board[origin] == king:
+                return True
+        queen = QUEEN * by_side
+        bishop = BISHOP * by_side
+        for ray in BISHOP_RAYS[sq]:
+            for origin in ray:
+                piece = board[origin]
+                if piece:
+                    if piece == bishop or piece == queen:
+                        return True
+                    break
+        rook = ROOK * by_side
+        for ray in ROOK_RAYS[sq]:
+            for origin in ray:
+                piece = board[origin]
+                if piece:
+                    if piece == rook or piece == queen:
+                        return True
+                    break
+        return False
+
+    def in_check(self, side=None):
+        if side is None:
+            side = self.side
+        king = self.kings[side]
+        return king is not None and self.is_attacked(king, -side)
+
+    def can_castle(self, side, kingside):
+        bit = (WHITE_KINGSIDE if kingside else WHITE_QUEENSIDE) if side == 1 else \
+              (BLACK_KINGSIDE if kingside else BLACK_QUEENSIDE)
+        if not self.castling & bit:
+            return False
+        board = self.board
+        home = KING_HOMES[side]
+        step = 1 if kingside else -1
+        corner = home + 3 if kingside else home - 4
+        if abs(board[home]) != KING or abs(board[corner]) != ROOK:
+            return False
+        for sq in range(min(home, corner) + 1, max(home, corner)):
+            if board[sq] != EMPTY:
+                return False
+        if self.is_attacked(home, -side):
+            return False
+        king = board[home]
+        board[home] = EMPTY
+        board[home + step] = king
+        attacked = self.is_attacked(home + step, -side)
+        if not attacked:
+            board[home + step] = ROOK * side
+            board[home + 2 * step] = king
+            rook = board[corner]
+            board[corner] = EMPTY
+            attacked = self.is_attacked(home + 2 * step, -side)
+            board[corner] = rook
+            board[home + 2 * step] = EMPTY
+        board[home + step] = EMPTY
+        board[home] = king
+        return not attacked
+
+    def checks_and_pins(self):
+        # Returns (checkers, check_mask, pin_masks): the number of pieces giving check,
+        # the squares a non-king move has to land on, and the ray each pinned piece is tied to
+        board = self.board
+        side = self.side
+        enemy = -side
+        king = self.kings[side]
+        checkers = 0
+        check_mask = ALL_SQUARES
+        pin_masks = {}
+        for rays, slider in ((BISHOP_RAYS[king], BISHOP * enemy), (ROOK_RAYS[king], ROOK * enemy)):
+            for ray in rays:
+                mask = 0
+                own = None
+                for sq in ray:
+                    mask |= 1 << sq
+                    piece = board[sq]
+                    if not piece:
+                        continue
+                    if piece * side > 0:
+                        if own is not None:
+                            break
+                        own = sq
+                        continue
+                    if piece == slider or piece == QUEEN * enemy:
+                        if own is None:
+                            checkers += 1
+                            check_mask &= mask
+                        else:
+                            pin_masks[own] = mask
+                    break
+        for attackers, attacker in ((KNIGHT_TARGETS[king], KNIGHT * enemy),
+                                    (PAWN_ATTACKERS[enemy][king], PAWN * enemy),
+                                    (KING_TARGETS[king], KING * enemy)):
+            for sq in attackers:
+                if board[sq] == attacker:
+                    checkers += 1
+                    check_mask &= 1 << sq
+        return checkers, check_mask, pin_masks
+
+    def legal_moves(self):
+        board = self.board
+        side = self.side
+        king = self.kings[side]
+        if king is None:
+            return []
+        checkers, check_mask, pin_masks = self.checks_and_pins()
+        moves = []
+        append = moves.append
+        for sq in range(64):
+            piece = board[sq] * side
+            if piece <= 0:
+                continue
+            if piece == KING:
+                board[sq] = EMPTY
+                for end in KING_TARGETS[sq]:
+                    if board[end] * side <= 0 and not self.is_attacked(end, -side):
+                        append(sq | end << 6)
+                board[sq] = KING * side
+                if sq == KING_HOMES[side] and not checkers:
+                    if self.can_castle(side, True):
+                        append(sq | (sq + 2) << 6)
+                    if self.can_castle(side, False):
+                        append(sq | (sq - 2) << 6)
+                continue
+            if checkers > 1:
+                continue
+            allowed = check_mask & pin_masks[sq] if sq in pin_masks else check_mask
+            if not allowed:
+                continue
+            if piece == PAWN:
+                step = PAWN_STEPS[side]
+                end = sq + step
+                if 0 <= end < 64 and board[end] == EMPTY:
+                    if allowed >> end & 1:
+                        append(sq | end << 6)
+                    if sq >> 3 == PAWN_START_ROWS[side] and board[end + step] == EMPTY and allowed >> (end + step) & 1:
+                        append(sq | (end + step) << 6)
+                for end in PAWN_CAPTURES[side][sq]:
+                    if board[end] * side < 0 and allowed >> end & 1:
+                        append(sq | end << 6)
+            elif piece == KNIGHT:
+                for end in KNIGHT_TARGETS[sq]:
+                    if board[end] * side <= 0 and allowed >> end & 1:
+                        append(sq | end << 6)
+            else:
+                for ray in SLIDER_RAYS[piece][sq]:
+                    for end in ray:
+                        target = board[end] * side
+                        if target == EMPTY:
+                            if allowed >> end & 1:
+                                append(sq | end << 6)
+                        else:
+                            if target < 0 and allowed >> end & 1:
+                                append(sq | end << 6)
+                            break
+        return moves
+
+    def legal_captures(self):
+        # The captures among legal_moves, in the same order, without generating the quiet moves
+        board = self.board
+        side = self.side
+        king = self.kings[side]
+        if king is None:
+            return []
+        checkers, check_mask, pin_masks = self.checks_and_pins()
+        moves = []
+        append = moves.append
+        for sq in range(64):
+            piece = board[sq] * side
+            if piece <= 0:
+                continue
+            if piece == KING:
+                board[sq] = EMPTY
+                for end in KING_TARGETS[sq]:
+                    if board[end] * side < 0 and not self.is_attacked(end, -side):
+                        append(sq | end << 6)
+                board[sq] = KING * side
+                continue
+            if checkers > 1:
+                continue
+            allowed = check_mask & pin_masks[sq] if sq in pin_masks else check_mask
+            if not allowed:
+                continue
+            if piece == PAWN:
+                targets = PAWN_CAPTURES[side][sq]
+            elif piece == KNIGHT:
+                targets = KNIGHT_TARGETS[sq]
+            else:
+                for ray in SLIDER_RAYS[piece][sq]:
+                    for end in ray:
+                        target = board[end] * side
+                        if target:
+                            if target < 0 and allowed >> end & 1:
+                                append(sq | end << 6)
+                            break
+                continue
+            for end in targets:
+                if board[end] * side < 0 and allowed >> end & 1:
+                    append(sq | end << 6)
+        return moves
+
+    def legal_quiets(self):
+        # The non-captures among legal_moves, in the same order, castling included
+        board = self.board
+        side = self.side
+        king = self.kings[side]
+        if king is None:
+            return []
+        checkers, check_mask, pin_masks = self.checks_and_pins()
+        moves = []
+        append = moves.append
+        for sq in range(64):
+            piece = board[sq] * side
+            if piece <= 0:
+                continue
+            if piece == KING:
+                board[sq] = EMPTY
+                for end in KING_TARGETS[sq]:
+                    if board[end] == EMPTY and not self.is_attacked(end, -side):
+                        append(sq | end << 6)
+                board[sq] = KING * side
+                if sq == KING_HOMES[side] and not checkers:
+                    if self.can_castle(side, True):
+                        append(sq | (sq + 2) << 6)
+                    if self.can_castle(side, False):
+                        append(sq | (sq - 2) << 6)
+                continue
+            if checkers > 1:
+                continue
+            allowed = check_mask & pin_masks[sq] if sq in pin_masks else check_mask
+            if not allowed:
+                continue
+            if piece == PAWN:
+                step = PAWN_STEPS[side]
+                end = sq + step
+                if 0 <= end < 64 and board[end] == EMPTY:
+                    if allowed >> end & 1:
+                        append(sq | end << 6)
+                    if sq >> 3 == PAWN_START_ROWS[side] and board[end + step] == EMPTY and allowed >> (end + step) & 1:
+                        append(sq | (end + step) << 6)
+            elif piece == KNIGHT:
+                for end in KNIGHT_TARGETS[sq]:
+                    if board[end] == EMPTY and allowed >> end & 1:
+                        append(sq | end << 6)
+            else:
+                for ray in SLIDER_RAYS[piece][sq]:
+                    for end in ray:
+                        if board[end]:
+                            break
+                        if allowed >> end & 1:
+                            append(sq | end << 6)
+        return moves
+
+    def is_legal(self, move):
+        # Whether a move found elsewhere, such as a hash move or killer, can be played here;
+        # checks the one move instead of generating them all
+        board = self.board
+        side = self.side
+        start, end = move & 63, move >> 6 & 63
+        piece = board[start] * side
+        if piece <= 0 or board[end] * side > 0:
+            return False
+        if piece == PAWN:
+            step = PAWN_STEPS[side]
+            if board[end]:
+                reachable = end in PAWN_CAPTURES[side][start]
+            else:
+                reachable = end == start + step or (end == start + 2 * step and start >> 3 == PAWN_START_ROWS[side]
+                                                    and board[start + step] == EMPTY)
+        elif piece == KNIGHT:
+            reachable = end in KNIGHT_TARGETS[start]
+        elif piece == KING:
+            if start == KING_HOMES[side] and abs(end - start) == 2:
+                return not self.in_check() and self.can_castle(side, end > start)
+            reachable = end in KING_TARGETS[start]
+        else:
+            reachable = False
+            for ray in SLIDER_RAYS[piece][start]:
+                if end in ray:
+                    for sq in ray:
+                        if sq == end:
+                            reachable = True
+                            break
+                        if board[sq]:
+                            break
+                    break
+        if not reachable:
+            return False
+        self.make_move(move)
+        legal = not self.in_check(side)
+        self.unmake_move()
+        return legal
+
+    def least_valuable_attacker(self, sq, side):
+        board = self.board
+        for origin in PAWN_ATTACKERS[side][sq]:
+            if board[origin] == PAWN * side:
+                return origin
+        for origin in KNIGHT_TARGETS[sq]:
+            if board[origin] == KNIGHT * side:
+                return origin
+        queen = None
+        for rays, slider in ((BISHOP_RAYS[sq], BISHOP * side), (ROOK_RAYS[sq], ROOK * side)):
+            for ray in rays:
+                for origin in ray:
+                    piece = board[origin]
+                    if piece:
+                        if piece == slider:
+                            return origin
+                        if piece == QUEEN * side and queen is None:
+                            queen = origin
+                        break
+        if queen is not None:
+            return queen
+        for origin in KING_TARGETS[sq]:
+            if board[origin] == KING * side:
+                return origin
+        return None
+
+    def see(self, move):
+        # Static exchange evaluation: the material the side to move nets if both sides keep
+        # recapturing on the target square with their cheapest piece while it pays to.
+        # Pins are ignored; pieces are lifted off the board so x-ray attackers join in.
+        board = self.board
+        start, target = move & 63, move >> 6 & 63
+        gains = [EXCHANGE_VALUES[board[target]]]
+        on_target = EXCHANGE_VALUES[board[start]]
+        removed = [(start, board[start])]
+        board[start] = EMPTY
+        side = -self.side
+        while True:
+            attacker = self.least_valuable_attacker(target, side)
+            if attacker is None:
+                break
+            gains.append(on_target - gains[-1])
+            on_target = EXCHANGE_VALUES[board[attacker]]
+            removed.append((attacker, board[attacker]))
+            board[attacker] = EMPTY
+            side = -side
+        for sq, piece in reversed(removed):
+            board[sq] = piece
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
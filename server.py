@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from engine import *
+from position import Position, move_name
+
+# Local analysis service: newline delimited JSON over TCP. Each request line is
+# {"id": ..., "fen": ..., "time_ms": ... or "depth": ...} and is answered by one line carrying the
+# same id; {"command": "metrics"} returns the service counters and latency percentiles. A client
+# that shuts down its sending side still gets every answer; a reset connection cancels them.
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+# Searches queued or running per worker before new requests are turned away
+QUEUE_PER_WORKER = 4
+CACHE_SIZE = 1024
+# Latencies kept for the percentiles in the metrics
+LATENCY_SAMPLES = 10000
+
+_service_searcher = None
+_service_stop = None
+
+
+class StopSlot:
+    # Lets a worker's Searcher read its own job's flag in the shared array as shared_stop.value
+    def __init__(self, flags):
+        self.flags = flags
+        self.slot = 0
+
+    @property
+    def value(self):
+        return self.flags[self.slot]
+
+
+def _init_service_worker(hash_mb, stop_flags):
+    # The searcher and its tables live as long as the worker, so later requests reuse them
+    global _service_searcher, _service_stop
+    _service_searcher = Searcher(hash_mb)
+    _service_stop = StopSlot(stop_flags)
+    _service_searcher.shared_stop = _service_stop
+
+
+def _warm_up():
+    return _service_searcher is not None
+
+
+def _search_request(fen, depth, max_time_ms, max_nodes, slot):
+    searcher = _service_searcher
+    _service_stop.slot = slot
+    position = Position.from_fen(fen)
+    start = time.perf_counter()
+    score, move = searcher.find_best_move(position, depth, max_time_ms, max_nodes)
+    elapsed = time.perf_counter() - start
+    return {'bestmove': move_name(move) if move is not None else None, 'score': format_score(score),
+            'depth': searcher.completed_depth, 'nodes': searcher.nodes,
+            'search_ms': round(elapsed * 1000, 3), 'nps': int(searcher.nodes / elapsed) if elapsed else 0,
+            'pv': [move_name(pv_move) for pv_move in searcher.pv]}
+
+
+def percentile(values, fraction):
+    # Nearest rank percentile of an unsorted list, None when it is empty
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Job:
+    # One search in the pool, shared by every request for the same position and limits
+    def __init__(self, future, slot):
+        self.future = future
+        self.slot = slot
+        self.waiters = 0
+        self.cancelled_at = None
+
+
+class AnalysisService:
+    def __init__(self, workers=DEFAULT_WORKERS, hash_mb=DEFAULT_HASH_MB, queue_limit=None, cache_size=CACHE_SIZE):
+        self.workers = workers
+        self.queue_limit = queue_limit or workers * QUEUE_PER_WORKER
+        self.stop_flags = multiprocessing.Array('b', self.queue_limit, lock=False)
+        self.free_slots = list(range(self.queue_limit))
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_service_worker,
+                                        initargs=(hash_mb, self.stop_flags))
+        self.jobs = {}
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        # Time from a cancelled search's stop flag being set until its worker gave it up
+        self.stop_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {'requests': 0, 'searches': 0, 'cache_hits': 0, 'merged': 0, 'rejected': 0,
+                         'cancelled': 0, 'errors': 0}
+
+    async def warm_up(self):
+        # Starts every worker, and so builds its searcher, before the first request arrives
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _warm_up) for _ in range(self.workers)))
+
+    def queue_depth(self):
+        return len(self.jobs)
+
+    def metrics(self):
+        latencies = list(self.latencies)
+        stop_latencies = list(self.stop_latencies)
+        return dict(self.counters, workers=self.workers, queue_depth=self.queue_depth(), queue_limit=self.queue_limit,
+                    cache_entries=len(self.cache),
+                    latency_ms={'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+                                'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                                'samples': len(latencies)},
+                    stop_ms={'p50': percentile(stop_latencies, 0.5), 'max': max(stop_latencies, default=None),
+                             'samples': len(stop_latencies)})
+
+    async def analyse(self, request):
+        # The response for one request; raises CancelledError when the client goes away
+        start = time.perf_counter()
+        self.counters['requests'] += 1
+        try:
+            response = await self.lookup(request)
+        except asyncio.CancelledError:
+            self.counters['cancelled'] += 1
+            raise
+        if 'error' in response:
+            self.counters['errors'] += response['error'] != 'busy'
+        else:
+            latency = round((time.perf_counter() - start) * 1000, 3)
+            self.latencies.append(latency)
+            response['latency_ms'] = latency
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def lookup(self, request):
+        try:
+            position = Position.from_fen(request['fen'])
+            depth = request.get('depth')
+            max_time_ms = request.get('time_ms')
+            max_nodes = request.get('nodes')
+            for limit in (depth, max_time_ms, max_nodes):
+                # bool is an int subclass, but true is no search limit
+                if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+                    raise ValueError(f"Invalid search limit: {limit}")
+        except (KeyError, ValueError, TypeError, AttributeError) as error:
+            return {'error': f"invalid request: {error}"}
+        # Move counters do not change the search, so they are left out of the key
+        fen = position.fen()
+        key = (fen, depth, max_time_ms, max_nodes)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.counters['cache_hits'] += 1
+            return dict(self.cache[key], cached=True)
+
+        job = self.jobs.get(key)
+        if job is not None:
+            self.counters['merged'] += 1
+        else:
+            if not self.free_slots:
+                self.counters['rejected'] += 1
+                return {'error': 'busy', 'queue_depth': self.queue_depth()}
+            slot = self.free_slots.pop()
+            self.stop_flags[slot] = 0
+            future = asyncio.get_running_loop().run_in_executor(
+                self.pool, _search_request, fen, depth, max_time_ms, max_nodes, slot)
+            job = self.jobs[key] = Job(future, slot)
+            future.add_done_callback(lambda _, key=key, job=job: self.finish(key, job))
+            self.counters['searches'] += 1
+        job.waiters += 1
+        try:
+            result = await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            job.waiters -= 1
+            if not job.waiters and not job.future.done():
+                # Nobody is left to answer, so the worker is told to stop and the job forgotten
+                self.stop_flags[job.slot] = 1
+                job.cancelled_at = time.perf_counter()
+                if self.jobs.get(key) is job:
+                    del self.jobs[key]
+            raise
+        except Exception as error:
+            return {'error': f"search failed: {error}"}
+        job.waiters -= 1
+        return dict(result, cached=False)
+
+    def finish(self, key, job):
+        # The slot is only reused once the worker is done with it
+        self.free_slots.append(job.slot)
+        if self.jobs.get(key) is job:
+            del self.jobs[key]
+        if job.cancelled_at is not None:
+            self.stop_latencies.append(round((time.perf_counter() - job.cancelled_at) * 1000, 3))
+        if job.future.cancelled() or job.future.exception() is not None or self.stop_flags[job.slot]:
+            return
+        self.cache[key] = job.future.result()
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def handle_client(self, reader, writer):
+        tasks = set()
+
+        async def send(message):
+            writer.write((json.dumps(message) + '\n').encode())
+            await writer.drain()
+
+        async def respond(request):
+            try:
+                await send(await self.analyse(request))
+            except ConnectionError:
+                pass
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    # The client may only have shut down its sending side, so whatever it asked
+                    # for before that is still answered
+                    if tasks:
+                        await asyncio.wait(tasks)
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected an object")
+                except ValueError as error:
+                    await send({'error': f"invalid json: {error}"})
+                    continue
+                if request.get('command') == 'metrics':
+                    await send(self.metrics())
+                    continue
+                task = asyncio.ensure_future(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            # A dropped connection cancels whatever it was still waiting for
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def shutdown(self):
+        for slot in range(self.queue_limit):
+            self.stop_flags[slot] = 1
+        self.pool.shutdown()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, hash_mb=DEFAULT_HASH_MB,
+                queue_limit=None, cache_size=CACHE_SIZE):
+    service = AnalysisService(workers, hash_mb, queue_limit, cache_size)
+    try:
+        await service.warm_up()
+        server = await asyncio.start_server(service.handle_client, host, port)
+        print(json.dumps({'listening': f"{host}:{port}", 'workers': workers, 'queue_limit': service.queue_limit}),
+              flush=True)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve move suggestions as JSON lines over TCP")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--hash', type=int, default=DEFAULT_HASH_MB, help="transposition table size per worker in MB")
+    parser.add_argument('--queue', type=int, help="searches queued or running before requests are turned away "
+                                                  f"(default: {QUEUE_PER_WORKER} per worker)")
+    parser.add_argument('--cache', type=int, default=CACHE_SIZE, help="results kept for repeated requests")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.hash, args.queue, args.cache))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from constants import MAX_SEARCH_DEPTH
+from endgame import WIN_SCORE
+from position import move_name
+
+# Table scores are WIN_SCORE minus the plies to mate
+MATE_SCORE_RANGE = 256
+
+
+class SearchStats:
+    # Filled in by a Searcher while its stats attribute points here. Counters cover the
+    # iteration in progress; each completed iteration is appended to iterations as a dict.
+    def __init__(self):
+        self.iterations = []
+        self.start_iteration(None)
+
+    def start_iteration(self, searcher):
+        self.ply_nodes = [0] * (MAX_SEARCH_DEPTH + 1)
+        self.leaf_nodes = 0
+        self.started = time.perf_counter()
+        if searcher is not None:
+            table = searcher.table
+            self.marks = (searcher.nodes, searcher.cutoffs, searcher.first_move_cutoffs, table.probes, table.hits)
+
+    def end_iteration(self, searcher, depth, score, move):
+        elapsed = time.perf_counter() - self.started
+        nodes, cutoffs, first_move_cutoffs, probes, hits = self.marks
+        nodes = searcher.nodes - nodes
+        cutoffs = searcher.cutoffs - cutoffs
+        first_move_cutoffs = searcher.first_move_cutoffs - first_move_cutoffs
+        probes = searcher.table.probes - probes
+        hits = searcher.table.hits - hits
+        previous = self.iterations[-1]['nodes'] if self.iterations else 0
+        self.iterations.append({
+            'depth': depth, 'score': score, 'move': move_name(move) if move else None,
+            'nodes': nodes, 'leaf_nodes': self.leaf_nodes,
+            'nodes_per_ply': self.ply_nodes[:depth + 1],
+            'cutoffs': cutoffs, 'first_move_cutoffs': first_move_cutoffs,
+            'first_move_cutoff_rate': round(first_move_cutoffs / cutoffs, 4) if cutoffs else 0.0,
+            'tt_probes': probes, 'tt_hit_rate': round(hits / probes, 4) if probes else 0.0,
+            'time': round(elapsed, 6), 'nps': int(nodes / elapsed) if elapsed else 0,
+            # Nodes this iteration over nodes the previous one: how much each extra ply costs
+            'branching_factor': round(nodes / previous, 3) if previous else None,
+        })
+
+    @property
+    def nodes(self):
+        return sum(iteration['nodes'] for iteration in self.iterations)
+
+    @property
+    def time(self):
+        return sum(iteration['time'] for iteration in self.iterations)
+
+    def effective_branching_factor(self):
+        # The b with b ** depth equal to the nodes of the deepest iteration
+        if not self.iterations:
+            return 0.0
+        last = self.iterations[-1]
+        return round(last['nodes'] ** (1 / last['depth']), 3) if last['depth'] else 0.0
+
+    def as_dict(self):
+        return {'nodes': self.nodes, 'time': round(self.time, 6),
+                'effective_branching_factor': self.effective_branching_factor(),
+                'iterations': self.iterations}
+
+
+def format_info(info):
+    # One UCI style "info" line for the dict passed to a Searcher's info callback
+    score = info['score']
+    if abs(score) == float('inf'):
+        # Plain search mates carry no distance; the iteration depth is an upper bound
+        plies = info['depth']
+        score_text = f"mate {(plies + 1) // 2 if score > 0 else -((plies + 1) // 2)}"
+    elif abs(score) > WIN_SCORE - MATE_SCORE_RANGE:
+        plies = WIN_SCORE - abs(score)
+        score_text = f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+    else:
+        score_text = f"cp {int(round(score * 100))}"
+    parts = [f"info depth {info['depth']}", f"score {score_text}", f"nodes {info['nodes']}",
+             f"nps {info['nps']}", f"time {info['time_ms']}"]
+    if 'hashfull' in info:
+        parts.append(f"hashfull {info['hashfull']}")
+    if info.get('pv'):
+        parts.append('pv ' + ' '.join(move_name(move) for move in info['pv']))
+    return ' '.join(parts)
+
+
+def print_info(info):
+    print(format_info(info), file=sys.stderr)
+
+
+class SamplingProfiler:
+    # Samples the profiled thread's stack from a helper thread, so the search itself
+    # runs unmodified; cheaper but coarser than cProfile
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = {}
+        self.total_counts = {}
+        self.running = False
+
+    def sample(self, thread_id):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            code = frame.f_code
+            top = (code.co_filename, code.co_firstlineno, code.co_name)
+            self.self_counts[top] = self.self_counts.get(top, 0) + 1
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                function = (code.co_filename, code.co_firstlineno, code.co_name)
+                if function not in seen:
+                    seen.add(function)
+                    self.total_counts[function] = self.total_counts.get(function, 0) + 1
+                frame = frame.f_back
+
+    def run(self, function, *args, **kwargs):
+        self.running = True
+        sampler = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True)
+        sampler.start()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.running = False
+            sampler.join()
+
+    def report(self, limit=30):
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms",
+                 f"{'self %':>8} {'total %':>8}  function"]
+        samples = self.samples or 1
+        ranked = sorted(self.total_counts, key=lambda function: (self.self_counts.get(function, 0),
+                                                                 self.total_counts[function]), reverse=True)
+        for filename, line, name in ranked[:limit]:
+            function = (filename, line, name)
+            lines.append(f"{self.self_counts.get(function, 0) * 100 / samples:8.1f} "
+                         f"{self.total_counts[function] * 100 / samples:8.1f}  {name} ({filename}:{line})")
+        return '\n'.join(lines) + '\n'
+
+
+def profile_call(function, *args, mode='cprofile', output=None, limit=30, **kwargs):
+    # Runs function under cProfile or the sampling profiler and writes the report to output
+    # (a path, or stderr when None); returns whatever function returned
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        result = profiler.runcall(function, *args, **kwargs)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(limit)
+        report = text.getvalue()
+    elif mode == 'sample':
+        profiler = SamplingProfiler()
+        result = profiler.run(function, *args, **kwargs)
+        report = profiler.report(limit)
+    else:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    if output is None:
+        sys.stderr.write(report)
+    else:
+        with open(output, 'w') as report_file:
+            report_file.write(report)
+    return result
@@ -0,0 +1,78 @@
+from array import array
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+DEFAULT_HASH_MB = 16
+
+# Each slot is a 64-bit key, a double score and a packed word holding
+# move (16 bits), depth (8 bits), bound (2 bits), search age (6 bits) and
+# an occupied flag.
+ENTRY_BYTES = 24
+MAX_AGE = 63
+OCCUPIED = 1 << 32
+# clear() zeroes the table this many bytes at a time
+CLEAR_CHUNK = bytes(1 << 16)
+
+
+class TranspositionTable:
+    __slots__ = ('size', 'mask', 'keys', 'scores', 'data', 'age', 'probes', 'hits', 'stores')
+
+    def __init__(self, size_mb=DEFAULT_HASH_MB):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        size = 1
+        while size * 2 <= entries:
+            size *= 2
+        self.size = size
+        self.mask = size - 1
+        self.keys = array('Q', bytes(8 * size))
+        self.scores = array('d', bytes(8 * size))
+        self.data = array('Q', bytes(8 * size))
+        self.age = 0
+        self.probes = self.hits = self.stores = 0
+
+    def clear(self):
+        # A slot without a data word is empty, so only the data words are zeroed, in place,
+        # rather than allocating all three arrays again
+        with memoryview(self.data) as view, view.cast('B') as data:
+            step = min(len(data), len(CLEAR_CHUNK))
+            zeros = CLEAR_CHUNK[:step]
+            for start in range(0, len(data), step):
+                data[start:start + step] = zeros
+        self.age = 0
+        self.probes = self.hits = self.stores = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & MAX_AGE
+
+    def probe(self, key):
+        # Returns (depth, score, bound, move) for a matching entry, otherwise None
+        self.probes += 1
+        index = key & self.mask
+        data = self.data[index]
+        if not data or self.keys[index] != key:
+            return None
+        self.hits += 1
+        return data >> 16 & 0xff, self.scores[index], data >> 24 & 3, data & 0xffff
+
+    def store(self, key, depth, score, bound, move):
+        index = key & self.mask
+        data = self.data[index]
+        age = self.age
+        # Depth preferred, but entries left over from earlier searches are always replaced
+        if data:
+            if self.keys[index] != key:
+                if data >> 26 & MAX_AGE == age and data >> 16 & 0xff > depth:
+                    return
+            elif not move:
+                move = data & 0xffff
+        self.stores += 1
+        self.keys[index] = key
+        self.scores[index] = score
+        self.data[index] = move | min(depth, 0xff) << 16 | bound << 24 | age << 26 | OCCUPIED
+
+    def hashfull(self):
+        sample = min(self.size, 1000)
+        used = sum(1 for index in range(sample) if self.data[index] and self.data[index] >> 26 & MAX_AGE == self.age)
+        return used * 1000 // sample
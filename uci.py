@@ -0,0 +1,259 @@
+import sys
+import threading
+# Only constants, engine and game are needed, none of which load pygame
+from constants import *
+from engine import *
+from game import GameState, START_FEN
+
+ENGINE_NAME = 'ChessAI'
+ENGINE_AUTHOR = 'ChessAI contributors'
+MIN_HASH_MB, MAX_HASH_MB = 1, 4096
+MAX_THREADS = 64
+# Time management: an even share of the clock plus most of the increment, less a safety margin
+DEFAULT_MOVES_TO_GO = 30
+MOVE_OVERHEAD_MS = 30
+MIN_MOVE_TIME_MS = 10
+# go arguments followed by a number; searchmoves takes moves up to the next known argument
+GO_LIMITS = ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'depth', 'nodes', 'mate', 'movetime')
+GO_FLAGS = ('infinite', 'ponder')
+
+
+class UCIEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.own_book = True
+        # Created on the first isready or go, so that "uci" is answered straight away
+        self.searcher = None
+        self.position = get_position_class().from_fen(START_FEN)
+        # Keys of the positions before self.position that it could still repeat
+        self.history = []
+        self.search = None
+        self.reporter = None
+        self.infinite = False
+        self.stop_requested = threading.Event()
+        self.ponder_budget = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def get_searcher(self):
+        if self.searcher is None:
+            if self.threads > 1:
+                self.searcher = ParallelSearcher(self.threads, self.hash_mb)
+            else:
+                self.searcher = Searcher(self.hash_mb)
+        return self.searcher
+
+    def reset_searcher(self):
+        self.stop_search()
+        if isinstance(self.searcher, ParallelSearcher):
+            self.searcher.shutdown()
+        self.searcher = None
+
+    def handle(self, line):
+        # Returns False once the engine should exit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min {MIN_HASH_MB} max {MAX_HASH_MB}")
+            self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+            self.send("option name OwnBook type check default true")
+            backends = ' '.join(f"var {name}" for name in POSITION_BACKENDS)
+            self.send(f"option name Backend type combo default {POSITION_BACKEND} {backends}")
+            self.send("uciok")
+        elif command == 'isready':
+            self.get_searcher()
+            self.send("readyok")
+        elif command == 'setoption':
+            self.set_option(arguments)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            if self.searcher is not None:
+                self.searcher.table.clear()
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(arguments)
+        elif command == 'go':
+            self.stop_search()
+            self.go(arguments)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            self.reset_searcher()
+            return False
+        return True
+
+    def set_option(self, arguments):
+        text = ' '.join(arguments)
+        if not text.startswith('name ') or ' value ' not in text:
+            return
+        name, value = text[5:].split(' value ', 1)
+        name = name.strip().lower()
+        value = value.strip()
+        if name in ('hash', 'threads'):
+            try:
+                number = int(value)
+            except ValueError:
+                self.send(f"info string invalid value {value} for {name}")
+                return
+        if name == 'hash':
+            self.hash_mb = min(MAX_HASH_MB, max(MIN_HASH_MB, number))
+            self.reset_searcher()
+        elif name == 'threads':
+            self.threads = min(MAX_THREADS, max(1, number))
+            self.reset_searcher()
+        elif name == 'ownbook':
+            self.own_book = value.lower() == 'true'
+        elif name == 'backend':
+            try:
+                set_position_backend(value.lower())
+            except ValueError:
+                self.send(f"info string unknown backend {value}")
+                return
+            self.position = get_position_class().from_fen(self.position.fen())
+        else:
+            self.send(f"info string unknown option {name}")
+
+    def set_position(self, arguments):
+        if not arguments:
+            return
+        if arguments[0] == 'startpos':
+            fen, rest = START_FEN, arguments[1:]
+        elif arguments[0] == 'fen':
+            fields = []
+            rest = arguments[1:]
+            while rest and rest[0] != 'moves':
+                fields.append(rest.pop(0))
+            fen = ' '.join(fields)
+        else:
+            return
+        try:
+            state = GameState.from_fen(fen, get_position_class())
+        except (ValueError, KeyError):
+            self.send(f"info string invalid fen {fen}")
+            return
+        if rest and rest[0] == 'moves':
+            for text in rest[1:]:
+                move = next((move for move in state.position.legal_moves() if move_name(move) == text), None)
+                if move is None:
+                    self.send(f"info string illegal move {text}")
+                    break
+                state.make_move(move)
+        self.position = state.position.copy()
+        self.history = state.search_history()
+
+    def go(self, arguments):
+        options = {}
+        flags = set()
+        search_moves = []
+        index = 0
+        while index < len(arguments):
+            name = arguments[index]
+            index += 1
+            if name in GO_FLAGS:
+                flags.add(name)
+            elif name == 'searchmoves':
+                while index < len(arguments) and arguments[index] not in GO_LIMITS + GO_FLAGS:
+                    search_moves.append(arguments[index])
+                    index += 1
+            elif name in GO_LIMITS and index < len(arguments):
+                # A missing or malformed number is left to be read as the next argument
+                try:
+                    options[name] = int(arguments[index])
+                    index += 1
+                except ValueError:
+                    pass
+
+        position = self.position.copy()
+        searcher = self.get_searcher()
+        root_moves = [move for move in position.legal_moves() if move_name(move) in search_moves]
+        if self.own_book and not flags and not root_moves:
+            book_move = probe_book(position)
+            if book_move is not None:
+                self.send(f"bestmove {move_name(book_move)}")
+                return
+
+        depth = options.get('depth')
+        max_nodes = options.get('nodes')
+        max_time_ms = options.get('movetime')
+        if max_time_ms is None:
+            max_time_ms = self.clock_budget(position, options)
+        self.infinite = 'infinite' in flags or 'ponder' in flags
+        self.ponder_budget = (max_time_ms, max_nodes) if 'ponder' in flags else None
+        if self.infinite:
+            depth, max_time_ms, max_nodes = depth or MAX_SEARCH_DEPTH, None, None
+        self.stop_requested.clear()
+        self.search = BackgroundSearch(searcher, position, depth, max_time_ms, max_nodes,
+                                       info=lambda info: self.send(format_info(info)), history=self.history,
+                                       root_moves=root_moves)
+        self.reporter = threading.Thread(target=self.report_best_move, args=(self.search,), daemon=True)
+        self.reporter.start()
+
+    def clock_budget(self, position, options):
+        side_time, increment = ('wtime', 'winc') if position.side == 1 else ('btime', 'binc')
+        if side_time not in options:
+            return None
+        remaining = options[side_time]
+        moves_to_go = options.get('movestogo') or DEFAULT_MOVES_TO_GO
+        budget = remaining / moves_to_go + options.get(increment, 0) * 3 / 4 - MOVE_OVERHEAD_MS
+        return int(max(MIN_MOVE_TIME_MS, min(budget, remaining - MOVE_OVERHEAD_MS)))
+
+    def report_best_move(self, search):
+        search.thread.join()
+        # In infinite and ponder mode the move may only be sent once the GUI asks for it
+        if self.infinite:
+            self.stop_requested.wait()
+        # No result means the search thread died, and a legal move is still owed to the GUI
+        move = search.result[1] if search.result is not None else None
+        if move is None:
+            legal_moves = search.position.legal_moves()
+            move = legal_moves[0] if legal_moves else None
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        pv = search.searcher.pv
+        if len(pv) > 1 and pv[0] == move:
+            self.send(f"bestmove {move_name(move)} ponder {move_name(pv[1])}")
+        else:
+            self.send(f"bestmove {move_name(move)}")
+
+    def ponderhit(self):
+        if self.search is None or self.ponder_budget is None:
+            return
+        max_time_ms, max_nodes = self.ponder_budget
+        self.ponder_budget = None
+        self.infinite = False
+        self.stop_requested.set()
+        self.search.searcher.ponderhit(max_time_ms, max_nodes)
+
+    def stop_search(self):
+        if self.search is None:
+            return
+        self.stop_requested.set()
+        self.search.stop()
+        self.reporter.join()
+        self.search = self.reporter = None
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.reset_searcher()
+
+
+if __name__ == "__main__":
+    main()